@@ -0,0 +1,269 @@
+"""Benchmarks of tracing, curve evaluation and rendering on generated lattices, from small to about 1M edges.
+
+Every stage gets a fresh input, is timed (best of --repeat runs), then run once more under tracemalloc
+for its peak memory, so that tracing does not slow the timed runs down. Results are stored in a JSON
+file under the current git commit, and can be compared with the ones of another commit.
+
+    python bench.py --sizes small medium
+    python bench.py --compare 84a5b1a
+    python bench.py --compare 84a5b1a ae6cdbc
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import tracemalloc
+from math import ceil, sqrt
+from random import Random
+from time import perf_counter, strftime
+
+import matplotlib
+matplotlib.use("Agg") # no display needed
+import matplotlib.pyplot as plt
+import numpy as np
+
+from mercat import Grid, CompactGrid, Knotwork, Point, ARC_CACHE, LATTICES, RIGHT, arc_controls, cubic_bezier, cubic_hermite, thread_arcs
+
+SIZES = {"small": 1000, "medium": 10000, "large": 100000, "huge": 1000000} # number of edges of the kolams, about
+
+SPREAD = 0.75
+LOOP_SIZE = 1.6
+DENSITY = 0.6 # fraction of the lattice edges kept in the kolams
+
+
+def kolam(lattice, size, seed=0):
+    """Points and edges of a random kolam with about size edges on a square-ish piece of lattice."""
+    points, edges = LATTICES[lattice](20, 20)
+    n = ceil(sqrt(size / DENSITY / len(edges) * 400))
+    points, edges = LATTICES[lattice](n, n)
+    return points, edges[np.random.default_rng(seed).random(len(edges)) < DENSITY]
+
+
+# Every stage does its setup and returns the function to measure.
+
+def build(points, edges):
+    return lambda: CompactGrid.from_arrays(points, edges)
+
+def build_grid(points, edges):
+    return lambda: Grid.from_arrays(points, edges)
+
+def validate(points, edges):
+    return CompactGrid.from_arrays(points, edges).validate
+
+def threads(points, edges):
+    return CompactGrid.from_arrays(points, edges).threads
+
+def thread_count(points, edges):
+    return CompactGrid.from_arrays(points, edges).thread_count
+
+def next_vertex(points, edges):
+    G = Grid.from_arrays(points, edges)
+    pairs = [(G.points[i], G.points[j]) for i, j in G.edge_array().tolist()]
+    pairs += [(v, u) for u, v in pairs]
+
+    def run():
+        for u, v in pairs:
+            G.next_vertex(u, v, RIGHT)
+    return run
+
+def path(points, edges):
+    G = Grid.from_arrays(points, edges)
+    starts = [(G.points[t[0]], G.points[t[1]]) for t in G.threads()]
+
+    def run():
+        for u, v in starts:
+            G.path(u, v, RIGHT)
+    return run
+
+def knotwork_update(points, edges):
+    G = Grid([Point(x, y) for x, y in points.tolist()])
+    knotwork = Knotwork(G, SPREAD, LOOP_SIZE)
+    knotwork.update(added=[(G.points[i], G.points[j]) for i, j in edges.tolist()])
+    random = Random(0)
+    toggled = [(G.points[i], G.points[j]) for i, j in edges[[random.randrange(len(edges)) for _ in range(100)]].tolist()]
+
+    def run():
+        for edge in toggled: # removed then added back
+            knotwork.update(removed=[edge])
+            knotwork.update(added=[edge])
+    return run
+
+def _scalar_curves(fun, points, edges):
+    G = CompactGrid.from_arrays(points, edges)
+    xy = G.coords()
+    u, v, w, clock, _ = thread_arcs(G.threads())
+    ctrl, cos = arc_controls(xy[u], xy[v], xy[w], clock, SPREAD, LOOP_SIZE)
+    arcs = [([Point(x, y) for x, y in c], k) for c, k in zip(ctrl.tolist(), cos.tolist())]
+    vals_01 = np.linspace(0, 1, 100).tolist()
+
+    def run():
+        for (a, b, c, d), k in arcs:
+            for t in vals_01:
+                fun(a, b, c, d, t, cos=k)
+    return run
+
+def bezier(points, edges):
+    return _scalar_curves(cubic_bezier, points, edges)
+
+def hermite(points, edges):
+    return _scalar_curves(cubic_hermite, points, edges)
+
+def curves(points, edges):
+    G = CompactGrid.from_arrays(points, edges)
+    G.threads()
+    return lambda: G.knotwork_lines(SPREAD, LOOP_SIZE, cache=None)
+
+def curves_cached(points, edges):
+    G = CompactGrid.from_arrays(points, edges)
+    G.threads()
+    ARC_CACHE.clear()
+    return lambda: G.knotwork_lines(SPREAD, LOOP_SIZE)
+
+def flatten(points, edges):
+    G = CompactGrid.from_arrays(points, edges)
+    G.threads()
+    return lambda: G.knotwork_lines(SPREAD, LOOP_SIZE, tolerance=0.01)
+
+def crossings(points, edges):
+    G = CompactGrid.from_arrays(points, edges)
+    G.threads()
+    return lambda: G.crossings(SPREAD, LOOP_SIZE)
+
+def plot(points, edges):
+    G = CompactGrid.from_arrays(points, edges)
+    G.threads()
+
+    def run():
+        plt.figure()
+        G.plot_knotwork(SPREAD, LOOP_SIZE, tolerance=0.01)
+        plt.savefig(io.BytesIO(), format="png", dpi=100)
+        plt.close()
+    return run
+
+def svg(points, edges):
+    G = CompactGrid.from_arrays(points, edges)
+    G.threads()
+    return lambda: G.save_svg(os.devnull, SPREAD, LOOP_SIZE)
+
+# name -> (stage, largest number of edges it is run on by default)
+STAGES = {
+    "build": (build, None),
+    "build_grid": (build_grid, 200000),
+    "validate": (validate, None),
+    "threads": (threads, None),
+    "thread_count": (thread_count, None),
+    "next_vertex": (next_vertex, 200000),
+    "path": (path, 200000),
+    "knotwork_update": (knotwork_update, 200000),
+    "bezier": (bezier, 2000),
+    "hermite": (hermite, 2000),
+    "curves": (curves, 200000),
+    "curves_cached": (curves_cached, 200000),
+    "flatten": (flatten, None),
+    "crossings": (crossings, 200000),
+    "plot": (plot, 200000),
+    "svg": (svg, 200000),
+}
+
+
+def measure(stage, points, edges, repeat=3, memory=True):
+    """Best time of repeat runs of a stage in seconds, and its peak memory in MB (None if not measured)."""
+    best = float("inf")
+    for _ in range(repeat):
+        run = stage(points, edges)
+        start = perf_counter()
+        run()
+        best = min(best, perf_counter() - start)
+    if not memory:
+        return best, None
+    tracemalloc.start()
+    run = stage(points, edges)
+    base = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    run()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return best, peak / 2 ** 20
+
+
+def commit():
+    """Short hash of the checked out commit, with a -dirty suffix when tracked files were modified."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        head = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=here, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=here, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return head + "-dirty" if dirty else head
+
+
+def compare(old, new, names=("old", "new")):
+    """Print the stages measured in both result sets, with the ratio new / old of their time and memory."""
+    print(f"{'case':<18} {'stage':<16} {names[0]:>10} {names[1]:>10} {'ratio':>7} {'peak MB':>17} {'ratio':>7}")
+    for case in old:
+        if case not in new:
+            continue
+        for name, before in old[case]["stages"].items():
+            after = new[case]["stages"].get(name)
+            if after is None:
+                continue
+            line = f"{case:<18} {name:<16} {before['seconds']:>9.4f}s {after['seconds']:>9.4f}s {after['seconds'] / max(before['seconds'], 1e-9):>7.2f}"
+            if before["peak_mb"] is not None and after["peak_mb"] is not None:
+                line += f" {before['peak_mb']:>8.1f} {after['peak_mb']:>8.1f} {after['peak_mb'] / max(before['peak_mb'], 1e-9):>7.2f}"
+            print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark tracing, curve evaluation and rendering on generated lattices.")
+    parser.add_argument("-l", "--lattices", nargs="+", choices=list(LATTICES), default=list(LATTICES))
+    parser.add_argument("-s", "--sizes", nargs="+", choices=list(SIZES), default=["small", "medium", "large"],
+                        help="about " + ", ".join(f"{name} : {size}" for name, size in SIZES.items()) + " edges (default: all but huge)")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--all", action="store_true", help="run every stage at every size, even the slow ones on large inputs")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="timed runs per stage, the best one is kept")
+    parser.add_argument("--no-memory", action="store_true", help="do not measure peak memory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="benchmarks.json", help="results file, keyed by commit")
+    parser.add_argument("--compare", nargs="+", metavar="COMMIT",
+                        help="compare the results of this run with the ones of a commit, or the ones of two commits without running anything")
+    args = parser.parse_args(argv)
+
+    stored = {}
+    if os.path.exists(args.output):
+        with open(args.output) as fh:
+            stored = json.load(fh)
+    for ref in args.compare or ():
+        if ref not in stored:
+            parser.error(f"no results for {ref} in {args.output}")
+    if args.compare and len(args.compare) > 1:
+        compare(stored[args.compare[0]]["results"], stored[args.compare[1]]["results"], args.compare[:2])
+        return 0
+
+    head = commit()
+    entry = stored.setdefault(head, {"results": {}})
+    entry.update(date=strftime("%Y-%m-%d %H:%M:%S"), python=platform.python_version(), numpy=np.__version__, machine=platform.machine())
+    results = entry["results"]
+    for lattice in args.lattices:
+        for size in args.sizes:
+            points, edges = kolam(lattice, SIZES[size], args.seed)
+            case = f"{lattice}/{size}"
+            result = results.setdefault(case, {"stages": {}})
+            result.update(points=len(points), edges=len(edges))
+            for name in args.stages:
+                stage, limit = STAGES[name]
+                if not args.all and limit is not None and len(edges) > limit:
+                    continue
+                seconds, peak = measure(stage, points, edges, args.repeat, not args.no_memory)
+                result["stages"][name] = {"seconds": seconds, "peak_mb": peak}
+                print(f"{case:<18} {name:<16} {seconds:>9.4f}s" + (f" {peak:>9.1f} MB" if peak is not None else ""), flush=True)
+            with open(args.output, "w") as fh: # saved as it goes, long runs can be stopped
+                json.dump(stored, fh, indent=1, sort_keys=True)
+    if args.compare:
+        compare(stored[args.compare[0]]["results"], results, (args.compare[0], head))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,138 @@
+"""Catalogue of all the kolams of a small lattice, up to its symmetries.
+
+Every subset of the lattice edges is a bitmask (bit i being row i of the lattice's edge_array()).
+Only the canonical ones, the smallest of their orbit under the symmetry group, are kept, with their
+number of threads and the size of their orbit. The range of masks is split in shards processed by a
+pool of processes, and each shard is written as soon as it is done, so the output is not sorted.
+
+    python catalogue.py 4 4 --cover -o square4x4.txt
+"""
+import argparse
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import perf_counter
+
+import numpy as np
+
+from mercat import CompactGrid, LATTICES, SYMMETRIES, batch_thread_counts, edge_group, point_permutations
+
+MAX_EDGES = 62 # masks are int64
+
+
+class Catalogue(object):
+    """Canonical edge subsets of a lattice under a symmetry group, along with their thread counts.
+
+    symmetry is a key of SYMMETRIES, or "auto" for the largest group among Dihedral, Mirrors and
+    HalfTurn the lattice has. When cover is set, subsets leaving a pulli without any edge are skipped.
+    """
+
+    def __init__(self, lattice, n, m, symmetry="auto", cover=False, chunk=1 << 14):
+        points, edges = LATTICES[lattice](n, m)
+        self.lattice = lattice
+        self.grid = CompactGrid.from_arrays(points, edges)
+        self.edges = self.grid.edge_array()
+        if len(self.edges) > MAX_EDGES:
+            raise ValueError(f"{len(self.edges)} edges, at most {MAX_EDGES} can be enumerated")
+        if symmetry == "auto":
+            for symmetry in ("Dihedral", "Mirrors", "HalfTurn", "None"):
+                try:
+                    self.group = edge_group(self.edges, point_permutations(points, symmetry))
+                    break
+                except ValueError:
+                    continue
+        else:
+            self.group = edge_group(self.edges, point_permutations(points, symmetry))
+        self.symmetry = symmetry
+        self.cover = cover
+        self.chunk = chunk
+        self.rows = self.grid.half_edge_rows()
+        self.incidence = np.zeros((len(self.edges), len(points)), dtype=np.int32)
+        self.incidence[np.arange(len(self.edges)), self.edges[:, 0]] = 1
+        self.incidence[np.arange(len(self.edges)), self.edges[:, 1]] = 1
+        # tables[g, k, b] : image under group element g of the mask made of the byte b at position k
+        nbytes = (len(self.edges) + 7) // 8
+        byte_bits = (np.arange(256)[:, None] >> np.arange(8)) & 1
+        self.tables = np.zeros((len(self.group), nbytes, 256), dtype=np.int64)
+        for k in range(nbytes):
+            for i in range(8 * k, min(8 * k + 8, len(self.edges))):
+                self.tables[:, k] |= byte_bits[:, i - 8 * k] << self.group[:, i, None]
+
+    def __len__(self):
+        """Number of edge subsets."""
+        return 1 << len(self.edges)
+
+    def images(self, masks):
+        """Images of the masks under every group element, as a (len(masks), g) array, identity first."""
+        images = np.zeros((len(self.group), len(masks)), dtype=np.int64)
+        for k in range(self.tables.shape[1]):
+            images |= self.tables[:, k, (masks >> (8 * k)) & 255]
+        return images.T
+
+    def shard(self, start, stop):
+        """Canonical masks in [start, stop), as arrays (masks, thread counts, orbit sizes)."""
+        found = ([], [], [])
+        for begin in range(start, stop, self.chunk):
+            masks = np.arange(begin, min(begin + self.chunk, stop), dtype=np.int64)
+            images = self.images(masks)
+            canonical = images[:, 0] == images.min(axis=1)
+            masks, images = masks[canonical], images[canonical]
+            bits = ((masks[:, None] >> np.arange(len(self.edges))) & 1).astype(bool)
+            if self.cover:
+                covering = (bits.astype(np.int32) @ self.incidence > 0).all(axis=1)
+                masks, images, bits = masks[covering], images[covering], bits[covering]
+            images.sort(axis=1)
+            found[0].append(masks)
+            found[1].append(batch_thread_counts(*self.grid.half_edges(), bits[:, self.rows]))
+            found[2].append((np.diff(images, axis=1) != 0).sum(axis=1) + 1)
+        return tuple(np.concatenate(arrays) if arrays else np.empty(0, dtype=np.int64) for arrays in found)
+
+    def header(self):
+        lines = [f"# {self.lattice} lattice, {len(self.grid)} pullis, {len(self.edges)} edges, {self.symmetry} symmetry ({len(self.group)} elements)"]
+        lines.append("# edges : " + " ".join(f"{i}-{j}" for i, j in self.edges.tolist()))
+        lines.append("# mask threads orbit_size")
+        return "\n".join(lines) + "\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Enumerate the kolams of a small lattice, up to symmetry.")
+    parser.add_argument("n", type=int, help="number of rows of the lattice")
+    parser.add_argument("m", type=int, help="number of columns of the lattice")
+    parser.add_argument("-l", "--lattice", choices=list(LATTICES), default="square")
+    parser.add_argument("-s", "--symmetry", choices=["auto"] + list(SYMMETRIES), default="auto")
+    parser.add_argument("--cover", action="store_true", help="skip kolams leaving a pulli without any edge")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes (default: all cores)")
+    parser.add_argument("--shards", type=int, help="number of shards (default: 16 per worker)")
+    parser.add_argument("-o", "--output", help="output file (default: standard output)")
+    args = parser.parse_args(argv)
+
+    try:
+        catalogue = Catalogue(args.lattice, args.n, args.m, args.symmetry, args.cover)
+    except ValueError as e: # symmetry the lattice does not have
+        parser.error(str(e))
+    shards = min(len(catalogue), args.shards or 16 * args.jobs)
+    size = -(-len(catalogue) // shards)
+    out = open(args.output, "w") if args.output else sys.stdout
+    out.write(catalogue.header())
+    start = perf_counter()
+    threads = Counter()
+    covered = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        jobs = [pool.submit(catalogue.shard, begin, min(begin + size, len(catalogue))) for begin in range(0, len(catalogue), size)]
+        for job in as_completed(jobs):
+            masks, counts, orbits = job.result()
+            out.write("".join(f"{mask:x} {count} {orbit}\n" for mask, count, orbit in zip(masks.tolist(), counts.tolist(), orbits.tolist())))
+            out.flush()
+            threads.update(counts.tolist())
+            covered += int(orbits.sum())
+    if out is not sys.stdout:
+        out.close()
+    print(f"{sum(threads.values())} kolams up to symmetry ({covered} in all) in {perf_counter() - start:.3f}s", file=sys.stderr)
+    for count in sorted(threads):
+        print(f"{count} thread(s) : {threads[count]}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,10 +1,34 @@
 import tkinter as tk
-from tkinter.filedialog import asksaveasfile,  askopenfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tkinter.filedialog import asksaveasfilename, askopenfilename
 from math import sqrt, ceil, floor
-from mercat import Grid, Point
-from random import random
+from random import shuffle
+from mercat import Grid, CompactGrid, Knotwork, Point, THREAD_COLORS, thread_colors, generate_edges, planarity_errors, plot_copies, plot_lines, square_lattice, triangular_lattice, hexagonal_lattice
 import matplotlib.pyplot as plt
-import re
+import numpy as np
+
+class Cancelled(Exception):
+    pass
+
+class Task(object):
+    """Computation run by a background worker, sharing its progress and a cancellation flag with the Tk thread."""
+
+    def __init__(self, name, work):
+        self.name = name
+        self.work = work
+        self.progress = 0
+        self.cancelled = threading.Event()
+        self.future = None
+
+    def run(self):
+        return self.work(self)
+
+    def report(self, progress):
+        """Called from the work function, raises Cancelled once the task was cancelled."""
+        if self.cancelled.is_set():
+            raise Cancelled
+        self.progress = progress
 
 class KolamApp(tk.Tk):
     def __init__(self, *args, **kwargs):
@@ -77,6 +101,19 @@ class ControlPanel(tk.Canvas):
         self.l5.grid(row=9, column=1)
         self.om3.grid(row=9, column=2)
 
+        self.e6 = tk.BooleanVar(self)
+        self.c1 = tk.Checkbutton(self, text = "Live preview", variable = self.e6, command = self.preview)
+        self.c1.grid(row=10, column=0)
+
+        self.b9 = tk.Button(self, text = "Cancel", command = self.cancel)
+        self.l6 = tk.Label(self, text = "")
+        self.b9.grid(row=11, column=0)
+        self.l6.grid(row=11, column=1, columnspan=2)
+
+        # mercatize is computed in a background thread, the Tk thread polls it with after()
+        self.worker = ThreadPoolExecutor(max_workers=1)
+        self.task = None
+
     def mouse_preset_1(self):
         self.master.pb.selected_pulli = None
         self.master.pb.bind("<ButtonPress-1>", self.master.pb.add_pulli)
@@ -87,14 +124,84 @@ class ControlPanel(tk.Canvas):
         self.master.pb.bind("<ButtonPress-3>", self.master.pb.remove_link)
 
     def clean(self):
+        self.cancel(restore=False)
+        self.master.pb.stop_preview()
         self.master.pb.clean()
+        self.restore_preview()
     
+    POLL_MS = 50
+    DRAW_CHUNK = 500 # links drawn per Tk event loop iteration
+
+    def run_task(self, name, work, done):
+        """Run work(task) in the background worker, then done(result) in the Tk thread."""
+        self.cancel()
+        self.task = Task(name, work)
+        self.task.future = self.worker.submit(self.task.run)
+        self.after(self.POLL_MS, self.poll, self.task, done)
+
+    def poll(self, task, done):
+        if task is not self.task: # cancelled or replaced
+            return
+        if not task.future.done():
+            self.l6.config(text = f"{task.name} : {task.progress:.0%}")
+            self.after(self.POLL_MS, self.poll, task, done)
+            return
+        self.task = None
+        try:
+            result = task.future.result()
+        except Cancelled:
+            return
+        except Exception as e:
+            self.l6.config(text = f"{task.name} failed : {e}")
+            return
+        self.l6.config(text = "")
+        done(result)
+
+    def cancel(self, restore=True):
+        """Cancel the running task, and trace the live preview again if drawing generated links had stopped it."""
+        if self.task is not None:
+            self.task.cancelled.set()
+            self.l6.config(text = f"{self.task.name} : cancelled")
+            self.task = None
+        if restore:
+            self.restore_preview()
+
+    def restore_preview(self):
+        if self.e6.get() and self.master.pb.knotwork is None:
+            self.master.pb.start_preview(self.e1.get() or "bezier")
+
     def mercatize(self):
-        fun = self.e1.get()
-        if fun != "":
-            self.master.pb.mercatize(fun)
+        fun = self.e1.get() or "bezier"
+        links = list(self.master.pb.links)
+        symmetry = self.master.pb.symmetry
+
+        def work(task):
+            G = grid_from_links(links, report=lambda done: task.report(0.3 * done))
+            if symmetry != "None":
+                try:
+                    G.set_symmetry(symmetry)
+                except ValueError: # edited or cancelled since, every arc is sampled
+                    pass
+            if G.symmetry != "None": # only a fundamental domain is sampled, then copied
+                lines, copies = G.knotwork_domain(0.75, 1.6, interp=fun)
+                colors = thread_colors()
+                shuffle(colors)
+                return plot_copies, (G.coords(), lines, [(matrix, [colors[t % len(colors)] for t in thread.tolist()]) for matrix, thread in copies])
+            lines, colors = G.knotwork_lines(0.75, 1.6, color_each_thread = True, interp=fun, report=lambda done: task.report(0.3 + 0.7 * done))
+            return plot_lines, (G.coords(), lines, colors)
+
+        def done(result):
+            plot, args = result
+            plot(*args)
+            plt.show()
+
+        self.run_task("Mercat", work, done)
+
+    def preview(self):
+        if self.e6.get():
+            self.master.pb.start_preview(self.e1.get() or "bezier")
         else:
-            self.master.pb.mercatize("bezier")
+            self.master.pb.stop_preview()
 
     def get_spacing(self):
         spacing = self.e2.get()
@@ -116,7 +223,9 @@ class ControlPanel(tk.Canvas):
         self.master.pb.save()
     
     def load(self):
+        self.cancel(restore=False)
         self.master.pb.load()
+        self.restore_preview()
     
     def generate(self):
         spacing = self.get_spacing()
@@ -125,11 +234,38 @@ class ControlPanel(tk.Canvas):
         if density != "":
             try:
                 density = float(density)
-                self.master.pb.generate(density, symmetry, spacing)
             except ValueError:
                 print("Invalid density")
+                return
         else:
-            self.master.pb.generate(0.5, symmetry, spacing)
+            density = 0.5
+        pb = self.master.pb
+        irange, jrange = pb.square_grid_ranges(spacing, square=True)
+        links = generate_edges(len(irange), len(jrange), density, symmetry) # vectorized, drawing them is the slow part
+        self.cancel(restore=False)
+        pb.stop_preview() # traced once at the end rather than on every link, see restore_preview
+        pb.clean()
+        pb.symmetry = symmetry
+        pullis = pb.create_square_grid(spacing, ranges=(irange, jrange))
+        self.task = Task("Drawing", None)
+        self.draw_links(self.task, pullis, links, 0)
+
+    def draw_links(self, task, pullis, links, start):
+        """Draw generated links by chunks, so that the window stays responsive."""
+        if task is not self.task: # cancelled or replaced
+            return
+        pb = self.master.pb
+        for i, j in links[start:start + self.DRAW_CHUNK].tolist():
+            if pullis[i] in pb.pullis and pullis[j] in pb.pullis: # not removed meanwhile
+                pb.new_link(pullis[i], pullis[j])
+        start += self.DRAW_CHUNK
+        if start < len(links):
+            self.l6.config(text = f"{task.name} : {start / len(links):.0%}")
+            self.after(1, self.draw_links, task, pullis, links, start)
+            return
+        self.task = None
+        self.l6.config(text = "")
+        self.restore_preview()
 
 class PulliBoard(tk.Canvas):
     PULLI_RADIUS = 10
@@ -137,12 +273,28 @@ class PulliBoard(tk.Canvas):
     RM_LINK = 2
     WIDTH = 960
     HEIGHT = 540
+    PREVIEW_SAMPLES = 8 # samples per arc of the live preview, the canvas smooths them
+    ZOOM_STEP = 1.25
+    MIN_ZOOM = 1 / 64
+    MAX_ZOOM = 16
 
     def __init__(self, *args, **kwargs):
-        self.pullis = []
-        self.links = []
+        # the model lives in board coordinates, the canvas only shows the part of it inside the viewport
+        self.pullis = set() # (x, y, id), ids are increasing
+        self.cells = {} # spatial hash of the pullis : (i, j) -> pullis whose center lies in that PULLI_RADIUS-sized cell
+        self.links = set() # (p1, p2), with p1 < p2
+        self.incident = {} # pulli -> keys of self.links of the links touching it
+        self.ovals = {} # pulli -> canvas oval, only for the visible pullis
+        self.lines = {} # link -> canvas line, only for the visible links
+        self.next_id = 0
+        self.longest_link = 0
+        self.origin = (0, 0) # board coordinates of the top left corner of the canvas
+        self.zoom = 1 # canvas pixels per board unit
+        self.pan_from = None
         self.selected_pulli = None
         self.last_event = self.ADD_LINK
+        self.knotwork = None # live preview of the knotwork, drawn on the board when not None
+        self.symmetry = "None" # of the generated or loaded kolam, checked again by mercatize as links may have been edited since
         kwargs["width"] = PulliBoard.WIDTH
         kwargs["height"] = PulliBoard.HEIGHT
         kwargs["bg"] = "white"
@@ -151,88 +303,249 @@ class PulliBoard(tk.Canvas):
         super().__init__(*args, **kwargs)
         self.bind("<Button-1>", self.add_pulli)
         self.bind("<Button-3>", self.remove_pulli)
+        self.bind("<ButtonPress-2>", self.start_pan)
+        self.bind("<B2-Motion>", self.pan)
+        self.bind("<ButtonRelease-2>", self.end_pan)
+        self.bind("<MouseWheel>", self.wheel) # Windows and macOS
+        self.bind("<Button-4>", self.wheel) # X11
+        self.bind("<Button-5>", self.wheel)
 
 
     def clean(self):
-        for p in self.pullis:
-            self.delete(p[2])
-        for link in self.links:
-            self.delete(link[2])
-        self.pullis = []
-        self.links = []
+        self.delete("pulli", "link")
+        self.pullis = set()
+        self.cells = {}
+        self.links = set()
+        self.incident = {}
+        self.ovals = {}
+        self.lines = {}
+        self.longest_link = 0
         self.selected_pulli = None
+        self.symmetry = "None"
+        if self.knotwork is not None:
+            self.start_preview(self.knotwork.interp)
+
+    def cell(self, x, y):
+        return (floor(x / self.PULLI_RADIUS), floor(y / self.PULLI_RADIUS))
     
     def get_pulli(self, x, y):
-        for pulli in self.pullis[::-1]:
-            if sqrt((pulli[0] - x) ** 2 + (pulli[1] - y) ** 2) <= self.PULLI_RADIUS:
-                return pulli
-        return None
+        """Last created pulli within PULLI_RADIUS of (x, y), looking only at the neighbouring cells."""
+        i, j = self.cell(x, y)
+        found = None
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                for pulli in self.cells.get((i + di, j + dj), ()):
+                    if sqrt((pulli[0] - x) ** 2 + (pulli[1] - y) ** 2) <= self.PULLI_RADIUS:
+                        if found is None or pulli[2] > found[2]:
+                            found = pulli
+        return found
+
+    def pullis_in(self, x0, y0, x1, y1):
+        """Pullis whose center lies in the given rectangle of the board."""
+        i0, j0 = self.cell(x0, y0)
+        i1, j1 = self.cell(x1, y1)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) < len(self.cells):
+            cells = (self.cells.get((i, j), ()) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1))
+        else: # zoomed far out, cheaper to go through the occupied cells
+            cells = self.cells.values()
+        for pullis in cells:
+            for pulli in pullis:
+                if x0 <= pulli[0] <= x1 and y0 <= pulli[1] <= y1:
+                    yield pulli
+
+    # viewport
+
+    def to_canvas(self, x, y):
+        return (x - self.origin[0]) * self.zoom, (y - self.origin[1]) * self.zoom
+
+    def to_board(self, x, y):
+        return x / self.zoom + self.origin[0], y / self.zoom + self.origin[1]
+
+    def view_bounds(self, margin=0):
+        """Rectangle of the board shown on the canvas, as (x0, y0, x1, y1)."""
+        x0, y0 = self.origin
+        return x0 - margin, y0 - margin, x0 + self.WIDTH / self.zoom + margin, y0 + self.HEIGHT / self.zoom + margin
+
+    def is_visible(self, p1, p2=None):
+        p2 = p2 or p1
+        x0, y0, x1, y1 = self.view_bounds(self.PULLI_RADIUS)
+        return min(p1[0], p2[0]) <= x1 and max(p1[0], p2[0]) >= x0 and min(p1[1], p2[1]) <= y1 and max(p1[1], p2[1]) >= y0
+
+    def set_view(self, origin, zoom):
+        """Move the viewport, the knotwork preview is transformed in place and the board redrawn."""
+        ratio = zoom / self.zoom
+        self.scale("knot", 0, 0, ratio, ratio)
+        self.move("knot", (self.origin[0] - origin[0]) * zoom, (self.origin[1] - origin[1]) * zoom)
+        self.origin = origin
+        self.zoom = zoom
+        self.redraw()
+
+    def redraw(self):
+        """Recreate the canvas items of the visible pullis and links only."""
+        self.delete("pulli", "link")
+        self.ovals = {}
+        self.lines = {}
+        for pulli in self.pullis_in(*self.view_bounds(self.PULLI_RADIUS)):
+            self.draw_pulli(pulli)
+        # a link is visible only if one of its ends is at most longest_link away from the viewport
+        for pulli in self.pullis_in(*self.view_bounds(self.PULLI_RADIUS + self.longest_link)):
+            for key in self.incident.get(pulli, ()):
+                if key not in self.lines and self.is_visible(*key):
+                    self.draw_link(key)
+
+    def draw_pulli(self, pulli):
+        x, y = self.to_canvas(pulli[0], pulli[1])
+        r = max(2, self.PULLI_RADIUS * self.zoom)
+        self.ovals[pulli] = self.create_oval(x - r, y - r, x + r, y + r, fill="red", tags="pulli")
+
+    def draw_link(self, key):
+        x1, y1 = self.to_canvas(key[0][0], key[0][1])
+        x2, y2 = self.to_canvas(key[1][0], key[1][1])
+        self.lines[key] = self.create_line(x1, y1, x2, y2, width=2, tags="link")
+
+    def wheel(self, event):
+        step = self.ZOOM_STEP if event.num == 4 or getattr(event, "delta", 0) > 0 else 1 / self.ZOOM_STEP
+        zoom = min(self.MAX_ZOOM, max(self.MIN_ZOOM, self.zoom * step))
+        x, y = self.to_board(event.x, event.y) # stays under the cursor
+        self.set_view((x - event.x / zoom, y - event.y / zoom), zoom)
+
+    def start_pan(self, event):
+        self.pan_from = (event.x, event.y)
+
+    def pan(self, event):
+        """Drag what is already drawn, the newly uncovered part is drawn on release."""
+        if self.pan_from is None:
+            return
+        dx, dy = event.x - self.pan_from[0], event.y - self.pan_from[1]
+        self.move("all", dx, dy)
+        self.origin = (self.origin[0] - dx / self.zoom, self.origin[1] - dy / self.zoom)
+        self.pan_from = (event.x, event.y)
+
+    def end_pan(self, event):
+        self.pan(event)
+        self.pan_from = None
+        self.redraw()
+
+    # model edits
+
+    def new_pulli(self, x, y):
+        pulli = (x, y, self.next_id)
+        self.next_id += 1
+        self.pullis.add(pulli)
+        self.cells.setdefault(self.cell(x, y), []).append(pulli)
+        if self.is_visible(pulli):
+            self.draw_pulli(pulli)
+        return pulli
+
+    def new_link(self, p1, p2):
+        """Register the link between two pullis, unless it already exists, and draw it if visible."""
+        key = (min(p1, p2), max(p1, p2))
+        if key in self.links:
+            return
+        self.links.add(key)
+        self.incident.setdefault(p1, set()).add(key)
+        self.incident.setdefault(p2, set()).add(key)
+        self.longest_link = max(self.longest_link, abs(p1[0] - p2[0]), abs(p1[1] - p2[1]))
+        if self.is_visible(*key):
+            self.draw_link(key)
+        if self.knotwork is not None:
+            self.draw_threads(*self.knotwork.add_edge(Point(p1[0], -p1[1]), Point(p2[0], -p2[1])))
+
+    def is_plane_link(self, p1, p2):
+        """Whether a link between two pullis would neither cross a link nor go through a pulli.
+
+        Only the pullis and links near it are checked : a link meeting it has an end at most
+        longest_link away from its bounding box.
+        """
+        margin = self.longest_link + self.PULLI_RADIUS
+        pullis = set(self.pullis_in(min(p1[0], p2[0]) - margin, min(p1[1], p2[1]) - margin, max(p1[0], p2[0]) + margin, max(p1[1], p2[1]) + margin))
+        links = {key for pulli in pullis for key in self.incident.get(pulli, ())}
+        pullis = list(pullis.union(*links, (p1, p2)))
+        index = {pulli: i for i, pulli in enumerate(pullis)}
+        edges = [(index[a], index[b]) for a, b in links] + [(index[p1], index[p2])]
+        crossing, close, inside = planarity_errors([pulli[:2] for pulli in pullis], edges)
+        new = len(edges) - 1
+        return not ((crossing == new).any() or (inside[:, 1] == new).any()
+                    or np.isin(inside[:, 0], (index[p1], index[p2])).any() or np.isin(close, (index[p1], index[p2])).any())
+
+    def delete_link(self, key):
+        self.links.remove(key)
+        if key in self.lines:
+            self.delete(self.lines.pop(key))
+        for pulli in key:
+            self.incident[pulli].discard(key)
+        if self.knotwork is not None:
+            self.draw_threads(*self.knotwork.remove_edge(Point(key[0][0], -key[0][1]), Point(key[1][0], -key[1][1])))
+
+    def start_preview(self, fun):
+        """Draw the knotwork on the board, and keep it up to date on every link edit."""
+        self.stop_preview()
+        G = grid_from_links(self.links)
+        self.knotwork = Knotwork(G, 0.75, 1.6, interp=fun, samples=self.PREVIEW_SAMPLES)
+        self.draw_threads((), self.knotwork.threads)
+
+    def stop_preview(self):
+        self.delete("knot")
+        self.knotwork = None
+
+    def draw_threads(self, removed, added):
+        """Replace the canvas lines of the removed threads by the ones of the added threads."""
+        for id in removed:
+            self.delete(f"thread{id}")
+        for id in added:
+            curve = self.knotwork.curve(id)
+            xy = np.column_stack((curve[:, 0] - self.origin[0], -curve[:, 1] - self.origin[1])) * self.zoom
+            color = thread_colors()[id % len(THREAD_COLORS)]
+            self.create_line(*xy.ravel().tolist(), smooth=True, fill=color, width=2, tags=("knot", f"thread{id}"))
 
     def add_pulli(self, event):
-        x = event.x
-        y = event.y
-        pulli = self.create_oval(x - self.PULLI_RADIUS, y - self.PULLI_RADIUS, x + self.PULLI_RADIUS, y + self.PULLI_RADIUS, fill="red")
-        self.pullis.append((x, y, pulli))
+        self.new_pulli(*self.to_board(event.x, event.y))
 
     def remove_pulli(self, event):
-        pulli = self.get_pulli(event.x, event.y)
+        pulli = self.get_pulli(*self.to_board(event.x, event.y))
         if pulli is None:
             return
         self.pullis.remove(pulli)
-        self.delete(pulli[2])
-        for link in self.links[:]: # [:] to iterate over a copy since we remove element of self.links on the fly.
-            if pulli in link:
-                self.delete(link[2])
-                self.links.remove(link)
+        self.cells[self.cell(pulli[0], pulli[1])].remove(pulli)
+        if pulli in self.ovals:
+            self.delete(self.ovals.pop(pulli))
+        for key in list(self.incident.get(pulli, ())):
+            self.delete_link(key)
+        self.incident.pop(pulli, None)
 
     def add_link(self, event):
-        pulli = self.get_pulli(event.x, event.y)
+        pulli = self.get_pulli(*self.to_board(event.x, event.y))
         if pulli is None:
             return
         if (self.selected_pulli is not None) and (self.last_event == self.ADD_LINK):
             p1 = min(self.selected_pulli, pulli)
             p2 = max(self.selected_pulli, pulli)
-            if p1 == p2:
+            if p1 == p2 or (p1, p2) in self.links:
                 return
-            for link in self.links:
-                if link[0] == p1 and link[1] == p2:
-                    break
-            else:
-                line = self.create_line(p1[0], p1[1], p2[0], p2[1], width=2)
-                self.links.append((p1, p2, line))
+            if not self.is_plane_link(p1, p2):
+                print("Invalid link : it would cross another link or a pulli")
                 self.selected_pulli = None
+                return
+            self.new_link(p1, p2)
+            self.selected_pulli = None
         else:
             self.selected_pulli = pulli
             self.last_event = self.ADD_LINK
 
     def remove_link(self, event):
-        pulli = self.get_pulli(event.x, event.y)
+        pulli = self.get_pulli(*self.to_board(event.x, event.y))
         if pulli is None:
             return
         if (self.selected_pulli is not None) and (self.last_event == self.RM_LINK):
             p1 = min(self.selected_pulli, pulli)
             p2 = max(self.selected_pulli, pulli)
-            for link in self.links:
-                if link[0] == p1 and link[1] == p2:
-                    self.delete(link[2])
-                    self.links.remove(link)
-                    self.selected_pulli = None
+            if (p1, p2) in self.links:
+                self.delete_link((p1, p2))
+                self.selected_pulli = None
         else:
             self.selected_pulli = pulli
             self.last_event = self.RM_LINK
     
-    def mercatize(self, fun):
-        G = Grid([])
-        for link in self.links:
-            p1 = Point(link[0][0], -link[0][1])
-            p2 = Point(link[1][0], -link[1][1])
-            G.add_point(p1)
-            G.add_point(p2)
-            G.add_edge(p1, p2)
-        G.plot_knotwork(0.75, 1.6, color_each_thread = True, interp=fun)
-        # G.plot()
-        plt.show()
-    
     def create_pulli_grid(self, shape, spacing = 100):
         match = {
             "square": self.create_square_grid,
@@ -241,163 +554,91 @@ class PulliBoard(tk.Canvas):
         }
         match[shape](spacing)
     
-    def create_square_grid(self, spacing, square=False):
-        ret = []
-        dist = max(self.WIDTH, self.HEIGHT)
-        hd = int(((dist - self.WIDTH) // 2) * square)
-        vd = int(((dist - self.HEIGHT) // 2) * square)
-        for i in range(2 * self.PULLI_RADIUS + vd, self.WIDTH - vd, spacing):
-            ret.append([])
-            for j in range(2 * self.PULLI_RADIUS + hd, self.HEIGHT - hd, spacing):
-                pulli = self.create_oval(i - self.PULLI_RADIUS, j - self.PULLI_RADIUS, i + self.PULLI_RADIUS, j + self.PULLI_RADIUS, fill="red")
-                self.pullis.append((i, j, pulli))
-                ret[-1].append((i, j, pulli))
-        return ret
+    def square_grid_ranges(self, spacing, square=False):
+        """Coordinates of the rows and columns of a square grid filling the visible part of the board."""
+        x0, y0, x1, y1 = self.view_bounds()
+        width, height = x1 - x0, y1 - y0
+        dist = max(width, height)
+        hd = int(((dist - width) // 2) * square)
+        vd = int(((dist - height) // 2) * square)
+        irange = range(int(x0) + 2 * self.PULLI_RADIUS + vd, int(x1) - vd, spacing)
+        jrange = range(int(y0) + 2 * self.PULLI_RADIUS + hd, int(y1) - hd, spacing)
+        if square: # rounding may leave one more row than columns
+            size = min(len(irange), len(jrange))
+            irange, jrange = irange[:size], jrange[:size]
+        return irange, jrange
+
+    def create_square_grid(self, spacing, square=False, ranges=None):
+        """Pullis of a square grid, in the order of the points of mercat.square_lattice."""
+        irange, jrange = ranges or self.square_grid_ranges(spacing, square)
+        points, _ = square_lattice(len(irange), len(jrange), spacing)
+        return self.new_pullis(points + (irange.start, jrange.start))
 
     def create_triangular_grid(self, spacing, hex=False):
         dbr = 2 * self.PULLI_RADIUS
+        x0, y0, x1, y1 = self.view_bounds()
+        width, height = int(x1 - x0), int(y1 - y0)
         
-        i0 = dbr - int(self.HEIGHT / sqrt(3))
-        imax = self.WIDTH - dbr
-
-        iind = 0
-        for i in range(i0, imax, spacing):
-            j0 = dbr
-            jmax = 2 * int(self.HEIGHT / sqrt(3)) + dbr
-            jind = 0
-            for j in range(j0, jmax, spacing):
-                x = i + j / 2
-                y = j * sqrt(3) / 2
-                if not hex or (jind % 3 != iind % 3):
-                    pulli = self.create_oval(x - self.PULLI_RADIUS, y - self.PULLI_RADIUS, x + self.PULLI_RADIUS, y + self.PULLI_RADIUS, fill="red")
-                    self.pullis.append((x, y, pulli))
-                jind += 1
-
-            iind += 1
+        irange = range(dbr - int(height / sqrt(3)), width - dbr, spacing)
+        jrange = range(dbr, 2 * int(height / sqrt(3)) + dbr, spacing)
+        lattice = hexagonal_lattice if hex else triangular_lattice
+        points, _ = lattice(len(irange), len(jrange), spacing)
+        return self.new_pullis(points + (x0 + irange.start + jrange.start / 2, y0 + jrange.start * sqrt(3) / 2))
 
     def create_hexagonal_grid(self, spacing):
-        self.create_triangular_grid(spacing, hex=True)
+        return self.create_triangular_grid(spacing, hex=True)
+
+    def new_pullis(self, points):
+        return [self.new_pulli(x, y) for x, y in points.tolist()]
                 
     def save(self):
-        G = Grid([])
-        for link in self.links:
-            p1 = Point(link[0][0], -link[0][1])
-            p2 = Point(link[1][0], -link[1][1])
-            G.add_point(p1)
-            G.add_point(p2)
-            G.add_edge(p1, p2)
-        fh = asksaveasfile(initialdir="Kolam-Project/saves")
-        fh.write(str(G))
-        fh.close()
+        G = grid_from_links(self.links)
+        filename = asksaveasfilename(initialdir="Kolam-Project/saves", filetypes=[("Binary grid", "*.npz"), ("Text grid", "*")])
+        if not filename:
+            return
+        G.save(filename)
 
     def load(self):
-        regexp = r"^((?:\([0-9e+\-.]+, [0-9e+\-.]+\) )*)-((?: (?:\([0-9e+\-.]+, [0-9e+\-.]+\)) (?:\([0-9e+\-.]+, [0-9e+\-.]+\)))*)$"
-        fh = askopenfile(initialdir="Kolam-Project/saves")
-        self.clean()
-        content = fh.readline()
-        match = re.search(regexp, content)
-        if match is None:
+        filename = askopenfilename(initialdir="Kolam-Project/saves")
+        if not filename:
+            return
+        try:
+            G = CompactGrid.load(filename) # the text format is still read, as a legacy format
+        except ValueError:
             print("Invalid file")
             return
-
-        pullis, links = content.split(" - ")
-        for pulli in re.findall(r"\([0-9e+\-.]*, [0-9e+\-.]*\)", pullis):
-            x, y = pulli[1:-1].split(", ")
-            x = float(x)
-            y = -float(y)
-            pulli = self.create_oval(x - self.PULLI_RADIUS, y - self.PULLI_RADIUS, x + self.PULLI_RADIUS, y + self.PULLI_RADIUS, fill="red")
-            self.pullis.append((x, y, pulli))
-
-        for link in re.findall(r"\([0-9e+\-.]*, [0-9e+\-.]*\) \([0-9e+\-.]*, [0-9e+\-.]*\)", links):
-            p1, p2 = re.findall(r"\([0-9e+\-.]*, [0-9e+\-.]*\)", link)
-            p1 = p1[1:-1].split(", ")
-            p2 = p2[1:-1].split(", ")
-            p1 = self.get_pulli(float(p1[0]), -float(p1[1]))
-            p2 = self.get_pulli(float(p2[0]), -float(p2[1]))
-            line = self.create_line(p1[0], p1[1], p2[0], p2[1], width=2)
-            self.links.append((p1, p2, line))
-    
-    def generate(self, density, symmetry, spacing):
+        try:
+            G.validate()
+        except ValueError as e:
+            print(f"Invalid file : {e}")
+            return
+        preview = self.knotwork
+        self.stop_preview() # traced once at the end rather than on every link
         self.clean()
-        pullis = self.create_square_grid(spacing, square=True)
-
-        i_amount = len(pullis)
-        j_amount = len(pullis[0])
-
-        if symmetry == "None":
-            imax = i_amount
-            jmax = j_amount
-        elif symmetry == "Vertical":
-            imax = i_amount // 2 + i_amount % 2
-            jmax = j_amount
-        elif symmetry == "Horizontal":
-            imax = i_amount
-            jmax = j_amount // 2 + j_amount % 2
-        elif symmetry == "Radial":
-            imax = i_amount // 2 + i_amount % 2
-            jmax = j_amount // 2
-            
-        for i in range(imax):
-            for j in range(jmax):
-                if i != len(pullis) - 1 and random() < density:
-                    # Horizontal link
-                    p1 = pullis[i][j]
-                    p2 = pullis[i + 1][j]
-                    line = self.create_line(p1[0], p1[1], p2[0], p2[1], width=2)
-                    self.links.append((p1, p2, line))
-                    if symmetry == "Vertical":
-                        p1 = pullis[-i - 1][j]
-                        p2 = pullis[-i - 2][j]
-                        line = self.create_line(p1[0], p1[1], p2[0], p2[1], width=2)
-                        self.links.append((p1, p2, line))
-                    elif symmetry == "Horizontal":
-                        p1 = pullis[i][-j - 1]
-                        p2 = pullis[i + 1][-j - 1]
-                        line = self.create_line(p1[0], p1[1], p2[0], p2[1], width=2)
-                        self.links.append((p1, p2, line))
-                    elif symmetry == "Radial":
-                        p1 = pullis[j][-i - 1]
-                        p2 = pullis[j][-i - 2]
-                        line = self.create_line(p1[0], p1[1], p2[0], p2[1], width=2)
-                        self.links.append((p1, p2, line))
-                        p1 = pullis[-j - 1][i]
-                        p2 = pullis[-j - 1][i + 1]
-                        line = self.create_line(p1[0], p1[1], p2[0], p2[1], width=2)
-                        self.links.append((p1, p2, line))
-                        p1 = pullis[-i - 1][-j - 1]
-                        p2 = pullis[-i - 2][-j - 1]
-                        line = self.create_line(p1[0], p1[1], p2[0], p2[1], width=2)
-                        self.links.append((p1, p2, line))
-
-                                                
-                if j != len(pullis[i]) - 1 and random() < density:
-                    p1 = pullis[i][j]
-                    p2 = pullis[i][j + 1]
-                    line = self.create_line(p1[0], p1[1], p2[0], p2[1], width=2)
-                    self.links.append((p1, p2, line))
-                    if symmetry == "Vertical":
-                        p1 = pullis[-i - 1][j]
-                        p2 = pullis[-i - 1][j + 1]
-                        line = self.create_line(p1[0], p1[1], p2[0], p2[1], width=2)
-                        self.links.append((p1, p2, line))
-                    elif symmetry == "Horizontal":
-                        p1 = pullis[i][-j - 1]
-                        p2 = pullis[i][-j - 2]
-                        line = self.create_line(p1[0], p1[1], p2[0], p2[1], width=2)
-                        self.links.append((p1, p2, line))
-                    elif symmetry == "Radial":
-                        p1 = pullis[j][-i - 1]
-                        p2 = pullis[j + 1][-i - 1]
-                        line = self.create_line(p1[0], p1[1], p2[0], p2[1], width=2)
-                        self.links.append((p1, p2, line))
-                        p1 = pullis[-j - 1][i]
-                        p2 = pullis[-j - 2][i]
-                        line = self.create_line(p1[0], p1[1], p2[0], p2[1], width=2)
-                        self.links.append((p1, p2, line))
-                        p1 = pullis[-i - 1][-j - 1]
-                        p2 = pullis[-i - 1][-j - 2]
-                        line = self.create_line(p1[0], p1[1], p2[0], p2[1], width=2)
-                        self.links.append((p1, p2, line))
+        pullis = self.new_pullis(G.coords() * (1, -1))
+
+        for i, j in G.edge_array().tolist():
+            self.new_link(pullis[i], pullis[j])
+        self.symmetry = G.symmetry
+        if preview is not None:
+            self.start_preview(preview.interp)
+
+
+def grid_from_links(links, report=None, chunk=1000):
+    """Grid of the given (p1, p2) links, in matplotlib coordinates (y pointing up).
+
+    When report is given, it is called with the fraction of links done every chunk links.
+    """
+    G = Grid([])
+    for k, link in enumerate(links):
+        if report is not None and k % chunk == 0:
+            report(k / len(links))
+        p1 = Point(link[0][0], -link[0][1])
+        p2 = Point(link[1][0], -link[1][1])
+        G.add_point(p1)
+        G.add_point(p2)
+        G.add_edge(p1, p2)
+    return G
 
 
 if __name__ == '__main__':
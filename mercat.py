@@ -1,18 +1,37 @@
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
+from matplotlib.collections import LineCollection
+from matplotlib.transforms import Affine2D
 from random import shuffle
 import numpy as np # trigonometric functions and pi, linspace for plotting with matplotlib
-from math import sqrt
+from math import sqrt, atan2
+from bisect import bisect
+from collections import OrderedDict
+import threading
+import re
 
 LEFT = 0
 RIGHT = 1
 
+# string representation of a Grid, as written by str()
+POINT_REGEXP = r"\(([0-9e+\-.]+), ([0-9e+\-.]+)\)"
+GRID_REGEXP = r"^((?:\([0-9e+\-.]+, [0-9e+\-.]+\) )*)-((?: (?:\([0-9e+\-.]+, [0-9e+\-.]+\)) (?:\([0-9e+\-.]+, [0-9e+\-.]+\)))*) ?$"
+
+NPZ_VERSION = 1 # version of the binary format written by Grid.save_npz
+
+THREAD_COLORS = ["purple", "green", "blue", "pink", "brown", "red", "teal", "orange", "magenta", "yellow"] # xkcd color names
+
+def thread_colors():
+    """Hex codes of THREAD_COLORS, in the same order."""
+    return [mcolors.XKCD_COLORS["xkcd:" + col] for col in THREAD_COLORS]
+
 class Point(object):
     """Basically a glorified 2D vector."""
 
     def __init__(self, x, y):
         self.x = x
         self.y = y
+        self._hash = hash((x, y)) # points are used as dict keys all over the place, and never modified
 
     def norm(self):
         return sqrt(self.x ** 2 + self.y ** 2)
@@ -21,7 +40,7 @@ class Point(object):
         return Point(self.x / self.norm(), self.y / self.norm())
 
     def __hash__(self):
-        return hash((self.x, self.y))
+        return self._hash
 
     def __eq__(self, other):
         if isinstance(other, Point):
@@ -66,123 +85,268 @@ class Point(object):
         return self.__mul__(other)
 
 
+class ArcCache(object):
+    """Bounded LRU cache of sampled knotwork arcs.
+
+    An arc only depends on the positions of u and w relative to v, its orientation and the drawing
+    parameters, so it is stored once, relative to v, and translated for each of its occurrences.
+    On lattices almost every arc is one of a handful of shapes. It can be shared between threads.
+    """
+
+    def __init__(self, maxsize=4096, decimals=9):
+        self.maxsize = maxsize
+        self.decimals = decimals # relative positions are rounded to that many decimals in the keys
+        self._curves = OrderedDict()
+        self._lock = threading.Lock() # the GUI samples from its worker and from the Tk thread
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._curves)
+
+    def clear(self):
+        with self._lock:
+            self._curves.clear()
+
+    def curves(self, u, v, w, clock, spread, loop_size, interp, t):
+        """Sampled arcs, as the (n, len(t), 2) array cubic_(bezier|hermite)_array would give for arc_controls(u, v, w, clock, ...)."""
+        fun = cubic_hermite_array if interp == "hermite" else cubic_bezier_array
+        clock = np.asarray(clock, dtype=bool)
+        d1, d2 = u - v, w - v
+        keys = np.column_stack((np.round(d1, self.decimals), np.round(d2, self.decimals), clock))
+        first, inverse = _unique_rows(keys)
+        keys = keys[first]
+        if len(keys) > self.maxsize: # no locality to exploit, do not flush the cache for nothing
+            ctrl, cos = arc_controls(u, v, w, clock, spread, loop_size)
+            return fun(ctrl, t, cos=cos)
+        params = (spread, loop_size, interp, len(t), t.tobytes())
+        shapes = np.empty((len(keys), len(t), 2))
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys.tolist()):
+                key = tuple(key) + params
+                if key in self._curves:
+                    self._curves.move_to_end(key)
+                    shapes[i] = self._curves[key]
+                else:
+                    missing.append(i)
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            arcs = first[missing]
+            ctrl, cos = arc_controls(d1[arcs], np.zeros((len(arcs), 2)), d2[arcs], clock[arcs], spread, loop_size)
+            shapes[missing] = fun(ctrl, t, cos=cos)
+            with self._lock:
+                for i in missing:
+                    self._curves[tuple(keys[i].tolist()) + params] = shapes[i]
+                while len(self._curves) > self.maxsize:
+                    self._curves.popitem(last=False)
+        return shapes[inverse] + v[:, None, :]
+
+
+def _unique_rows(keys):
+    # (first occurrence of every distinct row, index of the distinct row of every row), one column at a time,
+    # 1d sorts being much faster than np.unique(keys, axis=0)
+    codes = np.zeros(len(keys), dtype=np.int64)
+    for column in keys.T:
+        values, column = np.unique(column, return_inverse=True)
+        codes = codes * len(values) + column.reshape(-1) # below len(keys) ** 2 before being renumbered
+        _, codes = np.unique(codes, return_inverse=True)
+        codes = codes.reshape(-1)
+    _, first = np.unique(codes, return_index=True)
+    return first, codes
+
+
+ARC_CACHE = ArcCache() # shared by the default calls of Grid.knotwork_lines and Knotwork
+
+
 class Grid(object):
     def __init__(self, point_list):
         self.points = point_list
-        self.edges = {p : [] for p in point_list}
+        self.edges = {p : [] for p in point_list} # neighbours of each point, sorted counter-clockwise
+        self._angles = {p : [] for p in point_list} # angles of the neighbours, same order as self.edges
+        # rotation system : (v, u) -> neighbour of v coming right after u counter-clockwise (resp. clockwise)
+        self._ccw = {}
+        self._cw = {}
+        self._half_edges = None # cached result of half_edges()
+        self.symmetry = "None" # declared with set_symmetry, forgotten on every edit
+        self._group = None
 
     def add_point(self, u):
-        if u in self.points:
+        if u in self.edges:
             return
         self.points.append(u)
         self.edges[u] = []
+        self._angles[u] = []
+        self.symmetry = "None"
 
     def has_edge(self, u, v):
-        return v in self.edges[u]
+        return (u, v) in self._ccw
 
     def add_edge(self, u, v):
-        self.edges[u].append(v)
-        self.edges[v].append(u)
+        if self.has_edge(u, v):
+            return
+        self._insert_neighbour(u, v)
+        self._insert_neighbour(v, u)
+        self._half_edges = None
+        self.symmetry = "None"
+
+    def _insert_neighbour(self, v, w):
+        """Insert w in the cyclic ordering of the neighbours of v."""
+        angle = atan2(w.y - v.y, w.x - v.x)
+        i = bisect(self._angles[v], angle)
+        self._angles[v].insert(i, angle)
+        neighbours = self.edges[v]
+        neighbours.insert(i, w)
+        prev = neighbours[i - 1]
+        next = neighbours[(i + 1) % len(neighbours)]
+        self._ccw[(v, prev)] = w
+        self._ccw[(v, w)] = next
+        self._cw[(v, next)] = w
+        self._cw[(v, w)] = prev
+
+    def remove_edge(self, u, v):
+        if not self.has_edge(u, v):
+            return
+        self._remove_neighbour(u, v)
+        self._remove_neighbour(v, u)
+        self._half_edges = None
+        self.symmetry = "None"
+
+    def _remove_neighbour(self, v, w):
+        i = self.edges[v].index(w)
+        del self.edges[v][i]
+        del self._angles[v][i]
+        prev = self._cw.pop((v, w))
+        next = self._ccw.pop((v, w))
+        if prev != w:
+            self._ccw[(v, prev)] = next
+            self._cw[(v, next)] = prev
 
     def next_vertex(self, u, v, direction = RIGHT):
+        """Neighbour of v following u counter-clockwise (RIGHT) or clockwise (LEFT) around v."""
         assert self.has_edge(u, v)
-        if len(self.edges[v]) == 1:
-            return u
+        if direction == RIGHT:
+            return self._ccw[(v, u)]
+        return self._cw[(v, u)]
 
-        vu = Point.normed(Point(u.x - v.x, u.y - v.y))
-        min_angle = None
-        vert = None
+    def path(self, u, v, side):
+        assert self.has_edge(u, v)
+        turns = (self._cw, self._ccw) # indexed by LEFT and RIGHT
+        start = (u, v)
+        path = [u]
+        direction = side
+        while True:
+            u, v = v, turns[direction][(v, u)]
+            direction = 1 - direction
+            if direction == side and (u, v) == start:
+                return path
+            path.append(u)
 
-        for w in self.edges[v]:
-            if w == u:
-                continue
-            vw = Point.normed(Point(w.x - v.x, w.y - v.y))
-            det = (vu.x * vw.y - vu.y * vw.x)
-            dot = (vu.x * vw.x + vu.y * vw.y)
-            angle = np.arccos(dot)
-            if det < 0:
-                angle = 2 * np.pi - angle
+    def coords(self):
+        """Coordinates of the points, as an (n, 2) array in the order of self.points."""
+        return np.array([(p.x, p.y) for p in self.points], dtype=float).reshape(-1, 2)
 
-            if min_angle is None:
-                min_angle = angle
-                vert = w
+    def edge_array(self):
+        """Edges as an (m, 2) array of indices in self.points."""
+        index = {p : i for i, p in enumerate(self.points)}
+        return np.array([(index[u], index[v]) for u in self.edges for v in self.edges[u] if u < v], dtype=np.intp).reshape(-1, 2)
 
-            elif direction == RIGHT and angle <= min_angle:
-                min_angle = angle
-                vert = w
+    def half_edges(self):
+        """CSR rotation system (offsets, targets, twin) of the grid, see rotation_system."""
+        if self._half_edges is None:
+            self._half_edges = rotation_system(self.coords(), self.edge_array())
+        return self._half_edges
 
-            elif direction == LEFT and angle >= min_angle:
-                min_angle = angle
-                vert = w
+    def threads(self):
+        """Decompose the knotwork into threads, without drawing anything.
 
-        return vert
+        Returns a list of arrays of point indices, one per thread, in the format of path
+        (the first turn being RIGHT). Runs in linear time in the number of edges.
+        """
+        offsets, targets, twin = self.half_edges()
+        return trace_threads(offsets, twin)
 
-    def path(self, u, v, side):
-        done = []
-        starting_edge = (u, v)
-        edge = starting_edge
-        direction = side
-        iter = 0
-        while edge != starting_edge or iter % 2 == 1 or iter == 0:
-            done.append(edge)
-            next = self.next_vertex(edge[0], edge[1], direction)
-            edge = edge[1], next
-            direction = 1 - direction
-            iter += 1
+    def thread_count(self, keep=None):
+        """Number of threads of the knotwork and the number of arcs of each of them, see count_threads.
+
+        keep, if given, is an (m,) boolean mask of the rows of edge_array() : the threads are then
+        the ones of the grid made of these edges only, reusing the rotation system of the whole grid.
+        This is how many subsets of a same lattice are evaluated.
+        """
+        offsets, targets, twin = self.half_edges()
+        if keep is not None:
+            offsets, targets, twin = restrict_rotation(offsets, targets, twin, np.asarray(keep, dtype=bool)[self.half_edge_rows()])
+        return count_threads(offsets, twin)
 
-        return [edge[0] for edge in done]
+    def half_edge_rows(self):
+        """Row of edge_array() of every half-edge of half_edges()."""
+        offsets, targets, twin = self.half_edges()
+        edges = self.edge_array()
+        n = len(offsets) - 1
+        origin = np.repeat(np.arange(n), np.diff(offsets))
+        keys = edges.min(axis=1) * n + edges.max(axis=1)
+        order = np.argsort(keys)
+        return order[np.searchsorted(keys, np.minimum(origin, targets) * n + np.maximum(origin, targets), sorter=order)]
 
-    def plot_knotwork(self, spread, loop_size, color_each_arc = False, color_each_thread = True, interp = "bezier"):
+    def knotwork_lines(self, spread, loop_size, color_each_arc = False, color_each_thread = True, interp = "bezier", cache = ARC_CACHE, tolerance = None, report = None, chunk = 10000):
+        """Sampled knotwork, as a list of (k, 2) polylines and the list of their colors, without drawing anything.
+
+        Arcs of the same shape are sampled once through cache, an ArcCache, unless it is None.
+        When tolerance is given, arcs are flattened within that distance by flatten_controls rather
+        than sampled at 100 points each. When report is given, threads are processed by batches of
+        about chunk arcs and report(fraction done) is called after each of them.
+        """
         if interp == "hermite":
-            fun = cubic_hermite
+            fun = cubic_hermite_array
         else:
-            fun = cubic_bezier
-        plt.scatter([u.x for u in self.points], [u.y for u in self.points])
-        plt.axis("equal")
-        plt.axis('off')
-        todo = {(init, dir, side) for init in self.edges for dir in self.edges[init] for side in (RIGHT, )}
+            fun = cubic_bezier_array
+        xy = self.coords()
         # simples = [(init) for init in self.edges if self.edges[init] == []]
         # simple_rad = 1
-        colors = [mcolors.XKCD_COLORS["xkcd:" + col] for col in ["purple", "green", "blue", "pink", "brown", "red", "teal", "orange", "magenta", "yellow"]]
+        colors = thread_colors()
         # colors = list(mcolors.XKCD_COLORS.values()) # 954 common RGB colors, including some very pale shades
         shuffle(colors)
-        color = 0
         vals_01 = np.linspace(0, 1, 100)
 
-        while todo != set():
-            (init, dir, side) = todo.pop()
-            todo.add((init, dir, side))
-            done = self.path(init, dir, side)
-            done.append(done[0])
-            done.append(done[1])
-
-            clock = False
-            starting_side = side
-            current_side = starting_side
-            for i in range(len(done) - 2):
-                u, v, w = done[i], done[i + 1], done[i + 2]
-                if ((u, v, current_side)) in todo: # needs to be made better
-                    todo.remove((u, v, current_side))
+        threads = self.threads()
+        if not threads:
+            return [], []
+        ends = np.cumsum([len(t) for t in threads])
+        if report is None:
+            stops = [len(threads)]
+        else: # batches of whole threads
+            stops = np.unique(np.append(np.searchsorted(ends, np.arange(chunk, ends[-1], chunk)) + 1, len(threads))).tolist()
+        lines, line_colors = [], []
+        start = 0
+        for stop in stops:
+            u, v, w, clock, thread = thread_arcs(threads[start:stop])
+            first = ends[start - 1] if start else 0 # index of the first arc of the batch
+            thread += start
+            arc_colors = ((first + np.arange(len(u))) * color_each_arc + thread * color_each_thread) % len(colors)
+            if tolerance is not None:
+                ctrl, cos = arc_controls(xy[u], xy[v], xy[w], clock, spread, loop_size)
+                ctrl = bezier_controls(ctrl, cos, interp)
+                starts = np.arange(len(u)) if color_each_arc else np.flatnonzero(np.diff(thread, prepend=-1))
+                lines += flat_lines(*flatten_controls(ctrl, tolerance), ctrl[:, 3], starts)
+                line_colors.append(arc_colors[starts])
+            else:
+                if cache is not None:
+                    curves = cache.curves(xy[u], xy[v], xy[w], clock, spread, loop_size, interp, vals_01)
                 else:
-                    # print(f"problem: {(u, v, current_side)} not in todo")
-                    pass
-                current_side = 1 - current_side
-                mid1 = 0.5 * (u + v)
-                mid2 = 0.5 * (v + w)
-                dist = (mid1 - mid2).norm()
-                if dist <= 1e-14:
-                    dist = loop_size / spread * (v - u).norm()
-                n1 = rotate_45(Point.normed(v - u), clockwise = clock)
-                p1 = spread * dist * n1
-                n2 = rotate_45(Point.normed(v - w), clockwise = not clock)
-                p2 = spread * dist * n2
-                cos = n1.x * n2.x + n1.y * n2.y
-                arc = lambda t: fun(mid1, mid1 + p1, mid2 + p2, mid2, t, cos=cos)
-                xs, ys = zip(*[arc(t) for t in vals_01])
-                plt.plot(xs, ys, color=colors[color % len(colors)], label = f"{mid1} - {mid2}")
-                clock = not clock
-                color += color_each_arc
-            color += color_each_thread
+                    ctrl, cos = arc_controls(xy[u], xy[v], xy[w], clock, spread, loop_size)
+                    curves = fun(ctrl, vals_01, cos=cos) # all samples of all arcs in one batched call
+                if color_each_arc:
+                    lines += list(curves)
+                    line_colors.append(arc_colors)
+                else: # arcs of a thread are consecutive, draw each thread as a single polyline
+                    lengths = ends[start:stop] - np.append(first, ends[start:stop - 1])
+                    lines += [c.reshape(-1, 2) for c in np.split(curves, np.cumsum(lengths)[:-1])]
+                    line_colors.append(arc_colors[np.cumsum(lengths) - lengths])
+            start = stop
+            if report is not None:
+                report(ends[stop - 1] / ends[-1])
+        line_colors = np.concatenate(line_colors)
 
         # while simples != []:
         #     u = simples.pop()
@@ -198,16 +362,168 @@ class Grid(object):
         #     plt.plot(xs, ys, color=colors[color % len(colors)])
         #     color += 1
 
+        return lines, [colors[col] for col in line_colors.tolist()]
+
+    def plot_knotwork(self, spread, loop_size, color_each_arc = False, color_each_thread = True, interp = "bezier", tolerance = None):
+        if self.symmetry != "None" and not color_each_arc:
+            lines, copies = self.knotwork_domain(spread, loop_size, interp, tolerance=tolerance)
+            colors = thread_colors()
+            shuffle(colors)
+            plot_copies(self.coords(), lines, [(matrix, [colors[t * color_each_thread % len(colors)] for t in thread.tolist()]) for matrix, thread in copies])
+            return
+        lines, colors = self.knotwork_lines(spread, loop_size, color_each_arc, color_each_thread, interp, tolerance=tolerance)
+        plot_lines(self.coords(), lines, colors)
+
+    def set_symmetry(self, symmetry):
+        """Declare that the grid has the given symmetry (a key of SYMMETRIES), raises ValueError if it does not.
+
+        The declaration lasts until the next edit of the grid.
+        """
+        group = symmetry_group(self.coords(), symmetry)
+        edge_images(self.edge_array(), [perm for matrix, perm in group[1:]])
+        self.symmetry = symmetry
+        self._group = group
+
+    def knotwork_domain(self, spread, loop_size, interp = "bezier", cache = ARC_CACHE, tolerance = None):
+        """Sampled knotwork of a fundamental domain of the declared symmetry, and the copies making the whole knotwork.
+
+        Only one arc per orbit of the symmetry group is sampled, consecutive arcs of a thread being joined.
+        Returns these polylines as a list of (k, 2) arrays and, for every element of the group, the (3, 3)
+        affine matrix mapping them onto their copy along with the indices, in threads(), of the threads
+        of the copied polylines. tolerance is the same as in knotwork_lines.
+        """
+        xy = self.coords()
+        group = self._group if self.symmetry != "None" else symmetry_group(xy)
+        vals_01 = np.linspace(0, 1, 100)
+        threads = self.threads()
+        if not threads:
+            return [], [(matrix, np.empty(0, dtype=np.intp)) for matrix, perm in group]
+        u, v, w, clock, thread = thread_arcs(threads)
+        # an arc is identified by (u, v, clock), the image of an arc is either an arc or an arc walked backwards
+        n = len(xy)
+        keys = (u * n + v) * 2 + clock
+        order = np.argsort(keys)
+        images = np.empty((len(group), len(u)), dtype=np.intp)
+        for g, (matrix, perm) in enumerate(group):
+            side = clock ^ (np.linalg.det(matrix[:2, :2]) < 0) # reflections swap the sides
+            for query in ((perm[u] * n + perm[v]) * 2 + side, (perm[w] * n + perm[v]) * 2 + ~side):
+                found = order[np.searchsorted(keys, query, sorter=order).clip(max=len(keys) - 1)]
+                hit = keys[found] == query
+                images[g, hit] = found[hit]
+        reps = np.flatnonzero(images.min(axis=0) == np.arange(len(u)))
+        # a run of consecutive arcs of a thread is copied onto a single thread
+        starts = np.flatnonzero((np.diff(reps, prepend=-2) != 1) | (np.diff(thread[reps], prepend=-1) != 0))
+        if tolerance is not None:
+            ctrl, cos = arc_controls(xy[u[reps]], xy[v[reps]], xy[w[reps]], clock[reps], spread, loop_size)
+            ctrl = bezier_controls(ctrl, cos, interp)
+            lines = flat_lines(*flatten_controls(ctrl, tolerance), ctrl[:, 3], starts)
+        else:
+            if cache is not None:
+                curves = cache.curves(xy[u[reps]], xy[v[reps]], xy[w[reps]], clock[reps], spread, loop_size, interp, vals_01)
+            else:
+                ctrl, cos = arc_controls(xy[u[reps]], xy[v[reps]], xy[w[reps]], clock[reps], spread, loop_size)
+                curves = (cubic_hermite_array if interp == "hermite" else cubic_bezier_array)(ctrl, vals_01, cos=cos)
+            lines = [c.reshape(-1, 2) for c in np.split(curves, starts[1:])]
+        return lines, [(matrix, thread[images[g, reps[starts]]]) for g, (matrix, perm) in enumerate(group)]
+
+    def validate(self, tolerance = 1e-9):
+        """Raise ValueError if edges cross, points coincide or points lie on edges (see planarity_errors).
+
+        Mercat's algorithm needs a plane drawing of the grid and gives meaningless threads otherwise.
+        """
+        crossing, close, inside = planarity_errors(self.coords(), self.edge_array(), tolerance)
+        if len(crossing) or len(close) or len(inside):
+            raise ValueError(f"Not a plane grid : {len(crossing)} crossing edge(s), {len(close)} coincident point(s), {len(inside)} point(s) on edges")
+
+    def crossings(self, spread, loop_size, interp = "bezier", tolerance = 0.01):
+        """Crossings of the knotwork, found on its arcs flattened within tolerance (see flatten_controls).
+
+        Returns the (c, 2) crossing points and the (c, 2) indices of the two arcs crossing there, in the
+        order of thread_arcs(self.threads()), the arc going over first. Over and under alternate along
+        every thread (see alternate_crossings).
+        """
+        xy = self.coords()
+        threads = self.threads()
+        if not threads:
+            return np.empty((0, 2)), np.empty((0, 2), dtype=np.intp)
+        u, v, w, clock, thread = thread_arcs(threads)
+        ctrl, cos = arc_controls(xy[u], xy[v], xy[w], clock, spread, loop_size)
+        ctrl = bezier_controls(ctrl, cos, interp)
+        starts, offsets = flatten_controls(ctrl, tolerance)
+        # segments of all the arcs, arc after arc, so that a thread is a run of consecutive segments
+        arc = np.repeat(np.arange(len(u)), np.diff(offsets))
+        ends = np.roll(starts, -1, axis=0)
+        ends[offsets[1:] - 1] = ctrl[:, 3]
+        i, j, s, t = segment_crossings(np.stack((starts, ends), axis=1))
+        points = starts[i] + s[:, None] * (ends[i] - starts[i])
+        arcs = arc[np.column_stack((i, j))]
+        over = alternate_crossings(thread[arcs], np.column_stack((i + s, j + t)))
+        arcs[~over] = arcs[~over, ::-1]
+        return points, arcs
+
+    def save_svg(self, filename, spread, loop_size, color_each_thread = True, interp = "bezier", chunk = 10000):
+        """Write the knotwork to an SVG file, each thread being a path of cubic Bezier curves.
+
+        Arcs are written as native C commands from the control points computed by arc_controls,
+        without any sampling. Threads are processed by batches of about chunk arcs and written
+        as soon as they are computed, so memory does not grow with the size of the output.
+        """
+        xy = self.coords()
+        threads = self.threads()
+        pairs = self.edge_array()
+        colors = thread_colors()
+        length = np.linalg.norm(xy[pairs[:, 0]] - xy[pairs[:, 1]], axis=1).max() if len(pairs) else 1
+
+        def batches():
+            start = 0
+            while start < len(threads):
+                stop = start
+                size = 0
+                while stop < len(threads) and (size == 0 or size + len(threads[stop]) <= chunk):
+                    size += len(threads[stop])
+                    stop += 1
+                u, v, w, clock, _ = thread_arcs(threads[start:stop])
+                ctrl, cos = arc_controls(xy[u], xy[v], xy[w], clock, spread, loop_size)
+                ctrl = bezier_controls(ctrl, cos, interp)
+                ctrl[..., 1] *= -1 # SVG y axis points down
+                yield start, np.cumsum([len(t) for t in threads[start:stop]]), ctrl
+                start = stop
+
+        # first pass for the bounding box, the arcs stay in the convex hull of their control points
+        low = high = xy[:1] * [1, -1] if len(xy) else np.zeros((1, 2))
+        for start, bounds, ctrl in batches():
+            low = np.minimum(low, ctrl.reshape(-1, 2).min(axis=0))
+            high = np.maximum(high, ctrl.reshape(-1, 2).max(axis=0))
+        if len(xy):
+            low = np.minimum(low, (xy * [1, -1]).min(axis=0))
+            high = np.maximum(high, (xy * [1, -1]).max(axis=0))
+        (xmin, ymin), (xmax, ymax) = low.ravel() - length / 4, high.ravel() + length / 4
+
+        with open(filename, "w") as fh:
+            fh.write(f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="{xmin:.6g} {ymin:.6g} {xmax - xmin:.6g} {ymax - ymin:.6g}">\n')
+            fh.write(f'<g fill="none" stroke-width="{length / 20:.6g}">\n')
+            for start, bounds, ctrl in batches():
+                first = 0
+                for i, last in enumerate(bounds.tolist()):
+                    color = colors[((start + i) * color_each_thread) % len(colors)]
+                    arcs = ctrl[first:last]
+                    fh.write(f'<path stroke="{color}" d="M{arcs[0, 0, 0]:.6g},{arcs[0, 0, 1]:.6g}')
+                    fh.write("".join(["C%.6g,%.6g %.6g,%.6g %.6g,%.6g" % tuple(arc) for arc in arcs[:, 1:].reshape(-1, 6).tolist()]))
+                    fh.write('Z"/>\n')
+                    first = last
+            fh.write('</g>\n<g fill="black">\n')
+            for x, y in xy.tolist():
+                fh.write(f'<circle cx="{x:.6g}" cy="{-y:.6g}" r="{length / 10:.6g}"/>\n')
+            fh.write('</g>\n</svg>\n')
+
     def plot(self):
         plt.axis("equal")
         plt.axis('off')
-        plt.scatter([u.x for u in self.points], [u.y for u in self.points])
-        done = []
-        for u in self.edges:
-            for v in self.edges[u]:
-                if v not in done:
-                    plt.plot((u.x, v.x), (u.y, v.y), color="grey")
-            done.append(u)
+        xy = self.coords()
+        plt.scatter(xy[:, 0], xy[:, 1])
+        ax = plt.gca()
+        ax.add_collection(LineCollection(xy[self.edge_array()], colors="grey"))
+        ax.autoscale_view()
     
     def __str__(self):
         """Convert a Grid object to a string representation."""
@@ -215,6 +531,359 @@ class Grid(object):
         edges = " ".join([f"{str(u)} {str(v)}" for u in self.edges for v in self.edges[u] if u < v])
         return f"{points} - {edges}"
 
+    @classmethod
+    def from_string(cls, content):
+        """Build a Grid from its string representation, raises ValueError on invalid content."""
+        match = re.match(GRID_REGEXP, content.strip() + " ") # strip() also removes the trailing space left when there are no edges
+        if match is None:
+            raise ValueError("Invalid grid representation")
+        points, edges = match.groups()
+        G = cls([])
+        for x, y in re.findall(POINT_REGEXP, points):
+            G.add_point(Point(float(x), float(y)))
+        ends = [Point(float(x), float(y)) for x, y in re.findall(POINT_REGEXP, edges)]
+        for u, v in zip(ends[::2], ends[1::2]):
+            G.add_point(u)
+            G.add_point(v)
+            G.add_edge(u, v)
+        return G
+
+    @classmethod
+    def from_arrays(cls, points, edges):
+        """Build a Grid from an (n, 2) array of coordinates and an (m, 2) array of point indices."""
+        G = cls([])
+        points = [Point(x, y) for x, y in np.asarray(points, dtype=float).tolist()]
+        for p in points:
+            G.add_point(p)
+        for i, j in np.asarray(edges).tolist():
+            G.add_edge(points[i], points[j])
+        return G
+
+    def save_npz(self, filename):
+        """Save the grid in the binary format : versioned coordinate and edge index arrays, and the declared symmetry, in an uncompressed .npz file."""
+        np.savez(filename, version=NPZ_VERSION, points=self.coords(), edges=self.edge_array(), symmetry=self.symmetry)
+
+    @classmethod
+    def load_npz(cls, filename):
+        with np.load(filename) as data:
+            if "version" not in data or int(data["version"]) > NPZ_VERSION:
+                raise ValueError(f"Unsupported grid file : {filename}")
+            G = cls.from_arrays(data["points"], data["edges"])
+            if "symmetry" in data: # not in the files written before symmetries were declared
+                G.set_symmetry(str(data["symmetry"]))
+            return G
+
+    def save(self, filename):
+        """Save the grid, in the binary format if filename ends with .npz and as str(self) otherwise."""
+        if filename.endswith(".npz"):
+            self.save_npz(filename)
+        else:
+            with open(filename, "w") as fh:
+                fh.write(str(self))
+
+    @classmethod
+    def load(cls, filename):
+        """Load a grid saved by save, raises ValueError on invalid files."""
+        if filename.endswith(".npz"):
+            return cls.load_npz(filename)
+        with open(filename) as fh:
+            return cls.from_string(fh.readline())
+
+
+class CompactGrid(Grid):
+    """Array-backed Grid, for grids too large to hold one Python object per point.
+
+    Coordinates are stored in a float64 array and vertices are identified by integer ids,
+    with a (x, y) -> id hash to find them back. Edges are appended to an index array and the
+    adjacency is built lazily as a CSR structure sorted counter-clockwise around each vertex.
+    Vertices can be given to every method either as Point objects or as integer ids.
+    """
+
+    def __init__(self, point_list=()):
+        self._xy = np.empty((16, 2))
+        self._n = 0
+        self.ids = {}
+        self._pairs = np.empty((16, 2), dtype=np.intp)
+        self._m = 0
+        self._csr = None # (offsets, targets, twin, turn, origin), None when edges were added since the last build
+        self.symmetry = "None"
+        self._group = None
+        for p in point_list:
+            self.add_point(p)
+
+    @property
+    def points(self):
+        return [Point(x, y) for x, y in self._xy[:self._n].tolist()]
+
+    @property
+    def edges(self):
+        offsets, targets = self._build()[:2]
+        points = self.points
+        return {p : [points[w] for w in targets[offsets[i]:offsets[i + 1]].tolist()] for i, p in enumerate(points)}
+
+    def __len__(self):
+        return self._n
+
+    def point(self, i):
+        return Point(*self._xy[i].tolist())
+
+    @classmethod
+    def from_arrays(cls, points, edges):
+        G = cls()
+        G._xy = np.array(points, dtype=float).reshape(-1, 2)
+        G._n = len(G._xy)
+        G.ids = {key : i for i, key in enumerate(map(tuple, G._xy.tolist()))}
+        G._pairs = np.array(edges, dtype=np.intp).reshape(-1, 2)
+        G._m = len(G._pairs)
+        return G
+
+    def coords(self):
+        return self._xy[:self._n]
+
+    def edge_array(self):
+        self._build()
+        return self._pairs[:self._m]
+
+    def half_edges(self):
+        return self._build()[:3]
+
+    def _id(self, u):
+        if isinstance(u, Point):
+            return self.ids[(u.x, u.y)]
+        return int(u)
+
+    def add_point(self, u):
+        key = (u.x, u.y)
+        if key in self.ids:
+            return self.ids[key]
+        if self._n == len(self._xy):
+            self._xy = np.concatenate((self._xy, np.empty((max(16, len(self._xy)), 2))))
+        self._xy[self._n] = key
+        self.ids[key] = self._n
+        self._n += 1
+        self.symmetry = "None"
+        return self._n - 1
+
+    def add_edge(self, u, v):
+        if self._m == len(self._pairs):
+            self._pairs = np.concatenate((self._pairs, np.empty((max(16, len(self._pairs)), 2), dtype=np.intp)))
+        self._pairs[self._m] = (self._id(u), self._id(v))
+        self._m += 1
+        self._csr = None
+        self.symmetry = "None"
+
+    def remove_edge(self, u, v):
+        """Remove an edge, in O(m) : CompactGrid is meant to be built and traced in bulk."""
+        self._build()
+        u, v = sorted((self._id(u), self._id(v)))
+        pairs = self._pairs[:self._m]
+        pairs = pairs[(pairs[:, 0] != u) | (pairs[:, 1] != v)]
+        if len(pairs) == self._m:
+            return
+        self._pairs = np.concatenate((pairs, np.empty((max(16, len(pairs)), 2), dtype=np.intp)))
+        self._m = len(pairs)
+        self._csr = None
+        self.symmetry = "None"
+
+    def _build(self):
+        """Build the CSR adjacency, dropping duplicate edges and loops, if edges were added since the last call."""
+        if self._csr is None:
+            pairs = np.sort(self._pairs[:self._m], axis=1)
+            pairs = np.unique(pairs[pairs[:, 0] != pairs[:, 1]], axis=0)
+            self._pairs = np.concatenate((pairs, np.empty((max(16, len(pairs)), 2), dtype=np.intp)))
+            self._m = len(pairs)
+            offsets, targets, twin = rotation_system(self._xy[:self._n], pairs)
+            self._csr = offsets, targets, twin, turn_table(offsets, twin), np.repeat(np.arange(self._n), np.diff(offsets))
+        return self._csr
+
+    def _half_edge(self, u, v):
+        offsets, targets = self._build()[:2]
+        row = np.flatnonzero(targets[offsets[u]:offsets[u + 1]] == v)
+        if len(row) == 0:
+            return None
+        return offsets[u] + row[0]
+
+    def has_edge(self, u, v):
+        return self._half_edge(self._id(u), self._id(v)) is not None
+
+    def next_vertex(self, u, v, direction = RIGHT):
+        h = self._half_edge(self._id(u), self._id(v))
+        assert h is not None
+        targets, turn = self._build()[1:4:2]
+        w = targets[turn[direction, h]]
+        return self.point(w) if isinstance(u, Point) else int(w)
+
+    def path(self, u, v, side):
+        """Same as Grid.path, returns Points if given Points and an array of ids if given ids."""
+        start = self._half_edge(self._id(u), self._id(v))
+        assert start is not None
+        turn, origin = self._build()[3:]
+        done = []
+        h = start
+        direction = side
+        iter = 0
+        while h != start or iter % 2 == 1 or iter == 0:
+            done.append(h)
+            h = turn[direction, h]
+            direction = 1 - direction
+            iter += 1
+        ids = origin[done]
+        if isinstance(u, Point):
+            return [self.point(i) for i in ids]
+        return ids
+
+
+class Knotwork(object):
+    """Threads of a Grid, kept up to date when edges are added or removed.
+
+    A thread is stored as its path (starting with a RIGHT turn) and every state (u, v, side)
+    of the thread and of its reverse points to it. Editing an edge only changes the turns at
+    its two ends, so only the threads going through them are traced again, and only their
+    geometry is recomputed.
+    """
+
+    def __init__(self, grid, spread, loop_size, interp = "bezier", samples = 100, cache = ARC_CACHE, tolerance = None):
+        self.grid = grid
+        self.cache = cache
+        self.spread = spread
+        self.loop_size = loop_size
+        self.interp = interp
+        self.fun = cubic_hermite_array if interp == "hermite" else cubic_bezier_array
+        self.vals_01 = np.linspace(0, 1, samples)
+        self.tolerance = tolerance # when given, threads are flattened by flatten_controls instead of sampled
+        self.threads = {} # id -> path
+        self.owner = {} # (u, v, side) -> id of the thread going through that state
+        self._curves = {} # id -> sampled thread, computed on demand
+        self._next_id = 0
+        for u in grid.edges:
+            for v in grid.edges[u]:
+                if (u, v, RIGHT) not in self.owner:
+                    self._trace(u, v)
+
+    def __len__(self):
+        return len(self.threads)
+
+    def _states(self, path):
+        """States of a thread and of its reverse."""
+        n = len(path)
+        side = RIGHT
+        for i in range(n):
+            u, v, w = path[i], path[(i + 1) % n], path[(i + 2) % n]
+            yield (u, v, side)
+            yield (w, v, 1 - side)
+            side = 1 - side
+
+    def _trace(self, u, v):
+        path = self.grid.path(u, v, RIGHT)
+        id = self._next_id
+        self._next_id += 1
+        self.threads[id] = path
+        for state in self._states(path):
+            self.owner[state] = id
+        return id
+
+    def _release(self, points):
+        """Forget the threads going through the given points, returns their ids."""
+        released = set()
+        for v in points:
+            for u in self.grid.edges.get(v, ()):
+                for side in (LEFT, RIGHT):
+                    if (u, v, side) in self.owner:
+                        released.add(self.owner[(u, v, side)])
+        for id in released:
+            for state in self._states(self.threads.pop(id)):
+                del self.owner[state]
+            self._curves.pop(id, None)
+        return released
+
+    def _retrace(self, points):
+        """Trace the threads going through the given points that are not known yet, returns their ids."""
+        traced = set()
+        for v in points:
+            for u in self.grid.edges.get(v, ()):
+                if (u, v, RIGHT) not in self.owner:
+                    traced.add(self._trace(u, v))
+                if (u, v, LEFT) not in self.owner: # threads are traced from a RIGHT turn
+                    traced.add(self._trace(v, self.grid.next_vertex(u, v, LEFT)))
+        return traced
+
+    def update(self, added=(), removed=()):
+        """Add and remove edges (pairs of points) at once, returns the ids of the removed threads and of the new ones.
+
+        The threads going through several of the edited points are traced again only once.
+        """
+        for u, v in added:
+            self.grid.add_point(u)
+            self.grid.add_point(v)
+        added = [(u, v) for u, v in added if not self.grid.has_edge(u, v)]
+        removed = [(u, v) for u, v in removed if self.grid.has_edge(u, v)]
+        points = {p for edge in added + removed for p in edge}
+        if not points:
+            return set(), set()
+        released = self._release(points)
+        for u, v in added:
+            self.grid.add_edge(u, v)
+        for u, v in removed:
+            self.grid.remove_edge(u, v)
+        return released, self._retrace(points)
+
+    def add_edge(self, u, v):
+        """Add an edge to the grid, returns the ids of the removed threads and of the new ones."""
+        return self.update(added=[(u, v)])
+
+    def remove_edge(self, u, v):
+        """Remove an edge from the grid, returns the ids of the removed threads and of the new ones."""
+        return self.update(removed=[(u, v)])
+
+    def curve(self, id):
+        """Sampled thread, as a (k, 2) array."""
+        if id not in self._curves:
+            path = self.threads[id]
+            xy = np.array([(p.x, p.y) for p in path], dtype=float)
+            u, v, w, clock, _ = thread_arcs([np.arange(len(path))])
+            if self.tolerance is not None:
+                ctrl, cos = arc_controls(xy[u], xy[v], xy[w], clock, self.spread, self.loop_size)
+                ctrl = bezier_controls(ctrl, cos, self.interp)
+                self._curves[id] = flat_lines(*flatten_controls(ctrl, self.tolerance), ctrl[:, 3], [0])[0]
+            elif self.cache is not None:
+                curves = self.cache.curves(xy[u], xy[v], xy[w], clock, self.spread, self.loop_size, self.interp, self.vals_01)
+                self._curves[id] = curves.reshape(-1, 2)
+            else:
+                ctrl, cos = arc_controls(xy[u], xy[v], xy[w], clock, self.spread, self.loop_size)
+                self._curves[id] = self.fun(ctrl, self.vals_01, cos=cos).reshape(-1, 2)
+        return self._curves[id]
+
+
+def plot_lines(xy, lines, colors):
+    """Draw pullis and the polylines of a knotwork with matplotlib, one LineCollection per color."""
+    plt.scatter(xy[:, 0], xy[:, 1])
+    plt.axis("equal")
+    plt.axis('off')
+    ax = plt.gca()
+    by_color = {}
+    for line, color in zip(lines, colors):
+        by_color.setdefault(color, []).append(line)
+    for color, group in by_color.items():
+        ax.add_collection(LineCollection(group, colors=color))
+    ax.autoscale_view()
+
+def plot_copies(xy, lines, copies):
+    """Draw pullis and knotwork polylines with matplotlib, the same lines being drawn once per (matrix, colors) copy.
+
+    matrix is a (3, 3) affine matrix applied by matplotlib when drawing, and colors the color of every line.
+    """
+    plt.scatter(xy[:, 0], xy[:, 1])
+    plt.axis("equal")
+    plt.axis('off')
+    ax = plt.gca()
+    for matrix, line_colors in copies:
+        transform = Affine2D(matrix) + ax.transData
+        by_color = {}
+        for line, color in zip(lines, line_colors):
+            by_color.setdefault(color, []).append(line)
+        for color, group in by_color.items():
+            ax.add_collection(LineCollection(group, colors=color, transform=transform))
+    ax.autoscale_view()
 
 def cubic_bezier(u, v, w, p, t, **kwargs):
     # u, v, w, p : control points
@@ -245,6 +914,571 @@ def rotate_45(p, clockwise=True):
     else:
         return Point(b * (p.x + p.y), b * (p.y - p.x))
 
+def rotation_system(xy, pairs):
+    """Half-edge structure of the plane graph with coordinates xy (n, 2) and edges pairs (m, 2).
+
+    Returns CSR arrays (offsets, targets, twin) : the neighbours of vertex i are
+    targets[offsets[i]:offsets[i + 1]], sorted counter-clockwise, and twin[h] is the index
+    of the reverse of half-edge h.
+    """
+    n, m = len(xy), len(pairs)
+    src = np.concatenate((pairs[:, 0], pairs[:, 1]))
+    dst = np.concatenate((pairs[:, 1], pairs[:, 0]))
+    angles = np.arctan2(xy[dst, 1] - xy[src, 1], xy[dst, 0] - xy[src, 0])
+    order = np.lexsort((angles, src))
+    position = np.empty(2 * m, dtype=np.intp)
+    position[order] = np.arange(2 * m)
+    offsets = np.zeros(n + 1, dtype=np.intp)
+    np.cumsum(np.bincount(src, minlength=n), out=offsets[1:])
+    twin = position[(order + m) % (2 * m)] if m else np.empty(0, dtype=np.intp)
+    return offsets, dst[order], twin
+
+def trace_threads(offsets, twin):
+    """Threads of the rotation system (offsets, twin), as arrays of vertex ids (see Grid.threads).
+
+    A state is a half-edge along with the direction of the next turn. Each thread is walked
+    once in one orientation, marking its states and the states of its reverse in a visited
+    bitmap, so every state is looked at exactly once.
+    """
+    turn = turn_table(offsets, twin)
+    origin = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    turns = (turn[0].tolist(), turn[1].tolist())
+    twins = twin.tolist()
+    visited = (bytearray(len(twins)), bytearray(len(twins)))
+    threads = []
+    for start in range(len(twins)):
+        if visited[RIGHT][start]:
+            continue
+        walk = []
+        h = start
+        direction = RIGHT
+        while True:
+            walk.append(h)
+            next = turns[direction][h]
+            visited[direction][h] = 1
+            visited[1 - direction][twins[next]] = 1 # same arc, walked the other way
+            h = next
+            direction = 1 - direction
+            if h == start and direction == RIGHT:
+                break
+        threads.append(origin[walk])
+    return threads
+
+def restrict_rotation(offsets, targets, twin, keep):
+    """Rotation system of the subgraph made of the half-edges h where keep[h] is True (keep[twin] must equal keep).
+
+    Removing half-edges keeps the counter-clockwise order of the remaining ones, so no angle is computed again.
+    """
+    kept = np.flatnonzero(keep)
+    index = np.cumsum(keep) - 1
+    n = len(offsets) - 1
+    origin = np.repeat(np.arange(n), np.diff(offsets))
+    sub = np.zeros(n + 1, dtype=np.intp)
+    np.cumsum(np.bincount(origin[kept], minlength=n), out=sub[1:])
+    return sub, targets[kept], index[twin[kept]]
+
+def count_threads(offsets, twin):
+    """Number of threads of the rotation system (offsets, twin) and their lengths in arcs, without tracing them.
+
+    The states of trace_threads form a permutation whose cycles are the threads, each one twice
+    (once per orientation). Every state is joined to the smallest state of its cycle by pointer
+    jumping, which takes O(log(length of the longest thread)) passes over the arrays.
+    """
+    label, first = _thread_labels(offsets, twin)
+    return len(first), np.bincount(label, minlength=len(label))[first]
+
+def _thread_labels(offsets, twin):
+    # smallest state of the cycle of every state, and the first state of one orientation of each thread
+    h = len(twin)
+    turn = turn_table(offsets, twin)
+    # state d * h + e : arrived through half-edge e, turning in direction d next
+    following = np.concatenate((h + turn[LEFT], turn[RIGHT]))
+    reverse = np.concatenate((h + twin[turn[LEFT]], twin[turn[RIGHT]]))
+    label = np.arange(2 * h)
+    jump = following
+    while True:
+        new = np.minimum(label, label[jump])
+        if np.array_equal(new, label): # windows of doubled length brought nothing new, every cycle is covered
+            break
+        label = new
+        jump = jump[jump]
+    first = np.flatnonzero(label == np.arange(2 * h))
+    first = first[first < label[reverse[first]]] # one orientation of each thread
+    return label, first
+
+def batch_thread_counts(offsets, targets, twin, keep):
+    """Numbers of threads of many subgraphs of the rotation system (offsets, targets, twin) at once.
+
+    keep is a (b, h) boolean array, each row selecting half-edges as in restrict_rotation. The b
+    subgraphs are laid side by side as a single rotation system and counted with one count_threads.
+    """
+    keep = np.asarray(keep, dtype=bool)
+    b, h = keep.shape
+    n = len(offsets) - 1
+    offsets = np.append((offsets[:-1] + h * np.arange(b)[:, None]).ravel(), b * h)
+    targets = (targets + n * np.arange(b)[:, None]).ravel()
+    twin = (twin + h * np.arange(b)[:, None]).ravel()
+    offsets, targets, twin = restrict_rotation(offsets, targets, twin, keep.ravel())
+    label, first = _thread_labels(offsets, twin)
+    block = np.searchsorted(np.cumsum(keep.sum(axis=1)), first % len(twin), side="right")
+    return np.bincount(block, minlength=b)
+
+def thread_arcs(threads):
+    """Arcs of the given threads, as arrays (u, v, w, clock, thread).
+
+    Each arc goes around v from the middle of (u, v) to the middle of (v, w), clock is its
+    orientation as used by arc_controls and thread the index of the thread it belongs to.
+    """
+    lengths = np.array([len(t) for t in threads], dtype=np.intp)
+    u = np.concatenate(threads)
+    starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    size = np.repeat(lengths, lengths)
+    local = np.arange(len(u)) - starts
+    v = u[starts + (local + 1) % size]
+    w = u[starts + (local + 2) % size]
+    return u, v, w, local % 2 == 1, np.repeat(np.arange(len(threads)), lengths)
+
+def turn_table(offsets, twin):
+    """turn[direction, h] is the half-edge taken after arriving through h and turning RIGHT or LEFT."""
+    origin = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    start = offsets[origin]
+    degree = offsets[origin + 1] - start
+    local = np.arange(len(twin)) - start
+    turn = np.empty((2, len(twin)), dtype=np.intp)
+    turn[RIGHT, twin] = start + (local + 1) % degree
+    turn[LEFT, twin] = start + (local - 1) % degree
+    return turn
+
+def _cubic_array(basis, pts):
+    # basis : (k, 4) weights of the 4 terms for k parameter values
+    # pts : (n, 4, 2) terms of n arcs
+    return np.einsum("kj,njd->nkd", basis, pts)
+
+def cubic_bezier_array(ctrl, t, cos=None):
+    """Vectorized cubic_bezier, evaluating n arcs at k parameter values in one call.
+
+    ctrl is an (n, 4, 2) array of control points, t a (k,) array of parameters in [0-1]
+    and cos an optional (n,) array of cos factors. Returns an (n, k, 2) array of points.
+    """
+    ctrl = np.asarray(ctrl, dtype=float)
+    t = np.asarray(t, dtype=float)
+    c = 1 + (np.ones(len(ctrl)) if cos is None else np.asarray(cos, dtype=float))[:, None]
+    u, v, w, p = ctrl[:, 0], ctrl[:, 1], ctrl[:, 2], ctrl[:, 3]
+    pts = np.stack((u, u + c * (v - u), p + c * (w - p), p), axis=1)
+    s = 1 - t
+    basis = np.stack((s ** 3, 3 * t * s ** 2, 3 * s * t ** 2, t ** 3), axis=1)
+    return _cubic_array(basis, pts)
+
+def cubic_hermite_array(ctrl, t, cos=None):
+    """Vectorized cubic_hermite, same conventions as cubic_bezier_array."""
+    ctrl = np.asarray(ctrl, dtype=float)
+    t = np.asarray(t, dtype=float)
+    c = 1 + (np.ones(len(ctrl)) if cos is None else np.asarray(cos, dtype=float))[:, None]
+    u, v, w, p = ctrl[:, 0], ctrl[:, 1], ctrl[:, 2], ctrl[:, 3]
+    pts = np.stack((u, c * (v - u), c * (p - w), p), axis=1)
+    basis = np.stack((2 * t ** 3 - 3 * t ** 2 + 1, 6 * (t ** 3 - 2 * t ** 2 + t), 6 * (t ** 3 - t ** 2), -2 * t ** 3 + 3 * t ** 2), axis=1)
+    return _cubic_array(basis, pts)
+
+def bezier_controls(ctrl, cos, interp = "bezier"):
+    """Plain cubic Bezier control points of the arcs drawn by cubic_bezier_array or cubic_hermite_array."""
+    c = (1 + np.asarray(cos, dtype=float))[:, None]
+    if interp == "hermite":
+        c = 2 * c # the Hermite tangents are 6 * (1 + cos) times the control vectors
+    u, v, w, p = ctrl[:, 0], ctrl[:, 1], ctrl[:, 2], ctrl[:, 3]
+    return np.stack((u, u + c * (v - u), p + c * (w - p), p), axis=1)
+
+def flatten_controls(ctrl, tolerance, max_depth = 16):
+    """Adaptive flattening of cubic Bezier arcs given by their (n, 4, 2) plain control points.
+
+    Arcs are split in halves until every piece is within tolerance of its chord, or after max_depth
+    splits. Returns the (k, 2) start points of all the pieces, arc after arc, and the (n + 1,) offsets
+    of the arcs in them : arc i is the polyline points[offsets[i]:offsets[i + 1]] followed by ctrl[i, 3].
+    """
+    ctrl = np.asarray(ctrl, dtype=float)
+    n = len(ctrl)
+    arc = np.arange(n)
+    key = np.zeros(len(ctrl), dtype=np.int64) # position of the piece in its arc, in units of 2 ** -max_depth
+    limit = 16 * tolerance ** 2
+    found = []
+    for depth in range(max_depth + 1):
+        p0, p1, p2, p3 = ctrl[:, 0], ctrl[:, 1], ctrl[:, 2], ctrl[:, 3]
+        # the piece is within sqrt(error / 16) of its chord
+        error = np.maximum((3 * p1 - 2 * p0 - p3) ** 2, (3 * p2 - p0 - 2 * p3) ** 2).sum(axis=1)
+        flat = error <= limit if depth < max_depth else np.ones(len(ctrl), dtype=bool)
+        found.append((arc[flat], key[flat], p0[flat]))
+        if flat.all():
+            break
+        ctrl, arc, key = ctrl[~flat], arc[~flat], key[~flat]
+        p0, p1, p2, p3 = ctrl[:, 0], ctrl[:, 1], ctrl[:, 2], ctrl[:, 3]
+        p01, p12, p23 = 0.5 * (p0 + p1), 0.5 * (p1 + p2), 0.5 * (p2 + p3)
+        p012, p123 = 0.5 * (p01 + p12), 0.5 * (p12 + p23)
+        mid = 0.5 * (p012 + p123)
+        ctrl = np.concatenate((np.stack((p0, p01, p012, mid), axis=1), np.stack((mid, p123, p23, p3), axis=1)))
+        arc = np.concatenate((arc, arc))
+        key = np.concatenate((key, key + (1 << (max_depth - depth - 1))))
+    arc, key, points = (np.concatenate(a) for a in zip(*found))
+    order = np.lexsort((key, arc))
+    offsets = np.zeros(n + 1, dtype=np.intp)
+    np.cumsum(np.bincount(arc, minlength=n), out=offsets[1:])
+    return points[order], offsets
+
+def flat_lines(points, offsets, ends, starts):
+    """Polylines through runs of consecutive flattened arcs (see flatten_controls), the runs beginning at the arcs starts.
+
+    ends is the (n, 2) array of the end points of the arcs, and starts[0] must be 0.
+    """
+    starts = np.asarray(starts, dtype=np.intp)
+    stops = np.append(starts[1:], len(offsets) - 1)
+    points = np.insert(points, offsets[stops], ends[stops - 1], axis=0)
+    return np.split(points, (offsets[stops] + np.arange(1, len(stops) + 1))[:-1])
+
+def segment_crossings(segments, cell = None):
+    """Crossings of segments, found by bucketing them in a uniform grid of square cells rather than pairwise.
+
+    segments is a (k, 2, 2) array of end points and cell the side of the cells, the mean extent of the
+    segments by default. Returns the (c,) indices i < j of the crossing segments and the (c,) parameters
+    s, t of the crossing along each of them. Parameters are in [0, 1), those within 1e-9 of 0 or 1 being
+    rounded, so polylines crossing at one of their points cross only once. Parallel segments never cross.
+    """
+    segments = np.asarray(segments, dtype=float)
+    p, q = segments[:, 0], segments[:, 1]
+    i, j = _box_pairs(np.minimum(p, q), np.maximum(p, q), cell)
+    s, t = _segment_parameters(p[i], q[i], p[j], q[j])
+    with np.errstate(invalid="ignore"):
+        # crossings at end points must fall on one side of 1 on both segments meeting there
+        s = np.where(np.abs(s - np.round(s)) < 1e-9, np.round(s), s)
+        t = np.where(np.abs(t - np.round(t)) < 1e-9, np.round(t), t)
+        hit = (0 <= s) & (s < 1) & (0 <= t) & (t < 1)
+    return i[hit], j[hit], s[hit], t[hit]
+
+def _box_pairs(lo, hi, cell = None, first = None):
+    # pairs i < j of the (k, 2) boxes [lo, hi] sharing a cell of a uniform grid, each pair once,
+    # cell being the mean extent of the boxes by default, and only the pairs with i < first when given
+    k = len(lo)
+    if not k:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    if cell is None:
+        cell = (hi - lo).max(axis=1).mean() or 1
+    a = np.floor((lo - lo.min(axis=0)) / cell).astype(np.int64)
+    b = np.floor((hi - lo.min(axis=0)) / cell).astype(np.int64)
+    # every box is put in all the cells it meets
+    span = b - a + 1
+    count = span[:, 0] * span[:, 1]
+    box = np.repeat(np.arange(k), count)
+    local = np.arange(len(box)) - np.repeat(np.cumsum(count) - count, count)
+    cx, cy = a[box, 0] + local // span[box, 1], a[box, 1] + local % span[box, 1]
+    key = cx * (b[:, 1].max() + 1) + cy
+    order = np.argsort(key, kind="stable") # boxes stay sorted in a cell
+    box, cx, cy, key = box[order], cx[order], cy[order], key[order]
+    # pairs of boxes sharing a cell, kept in the first cell they share only
+    pairs = np.searchsorted(key, key, side="right") - np.arange(len(key)) - 1
+    if first is not None: # the boxes before first come first in every cell
+        pairs[box >= first] = 0
+    first = np.repeat(np.arange(len(key)), pairs)
+    second = first + 1 + np.arange(len(first)) - np.repeat(np.cumsum(pairs) - pairs, pairs)
+    i, j = box[first], box[second]
+    keep = (cx[first] == np.maximum(a[i, 0], a[j, 0])) & (cy[first] == np.maximum(a[i, 1], a[j, 1]))
+    return i[keep], j[keep]
+
+def _segment_parameters(p1, q1, p2, q2):
+    # parameters s, t of the intersection of the lines through the segments (p1, q1) and (p2, q2),
+    # nan or inf for parallel segments
+    r, d, e = q1 - p1, q2 - p2, p2 - p1
+    den = r[:, 0] * d[:, 1] - r[:, 1] * d[:, 0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = (e[:, 0] * d[:, 1] - e[:, 1] * d[:, 0]) / den
+        t = (e[:, 0] * r[:, 1] - e[:, 1] * r[:, 0]) / den
+    return s, t
+
+def planarity_errors(xy, edges, tolerance = 1e-9):
+    """Defects preventing the (m, 2) edges between the (n, 2) points xy from being drawn without crossings.
+
+    Returns the (c, 2) pairs of crossing edges, the (d, 2) pairs of points closer than tolerance and the
+    (e, 2) pairs (point, edge) of points closer than tolerance to the inside of an edge, all found through
+    a uniform grid of cells rather than pairwise.
+    """
+    xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+    edges = np.asarray(edges, dtype=np.intp).reshape(-1, 2)
+    m = len(edges)
+    p, q = xy[edges[:, 0]], xy[edges[:, 1]]
+    # cells about the size of the edges, but not so small that a long edge meets too many of them
+    span = np.ptp(xy, axis=0).max() if len(xy) else 0
+    cell = max(np.abs(q - p).max(axis=1).mean() if m else 0, span / sqrt(len(xy) or 1), 2 * tolerance) or 1
+    # edges first then points, in the same grid, the pairs of points being looked for apart
+    i, j = _box_pairs(np.concatenate((np.minimum(p, q), xy)) - tolerance, np.concatenate((np.maximum(p, q), xy)) + tolerance, cell, m)
+    a, b = i[j < m], j[j < m]
+    apart = (edges[a, :, None] != edges[b, None, :]).all(axis=(1, 2)) # edges sharing a point meet there
+    a, b = a[apart], b[apart]
+    s, t = _segment_parameters(p[a], q[a], p[b], q[b])
+    with np.errstate(invalid="ignore"):
+        crossing = (0 < s) & (s < 1) & (0 < t) & (t < 1) # edges touching at an end are reported as a point on an edge
+    c, d = _box_pairs(xy - tolerance, xy + tolerance, max(span / sqrt(len(xy) or 1), 2 * tolerance) or 1)
+    close = np.linalg.norm(xy[c] - xy[d], axis=1) <= tolerance
+    mixed = (i < m) & (j >= m)
+    e, k = i[mixed], j[mixed] - m
+    r = q[e] - p[e]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        along = np.clip(((xy[k] - p[e]) * r).sum(axis=1) / (r * r).sum(axis=1), 0, 1)
+    inside = (np.linalg.norm(p[e] + along[:, None] * r - xy[k], axis=1) <= tolerance) \
+        & (np.linalg.norm(xy[k] - p[e], axis=1) > tolerance) & (np.linalg.norm(xy[k] - q[e], axis=1) > tolerance)
+    return np.column_stack((a, b))[crossing], np.column_stack((c, d))[close], np.column_stack((k, e))[inside]
+
+def alternate_crossings(thread, position):
+    """Over and under crossings alternating along every thread.
+
+    thread and position are (c, 2) arrays of the threads of the two strands of c crossings and of the
+    position of the crossings along these threads. Returns a (c,) boolean array telling whether the first
+    strand goes over. Every thread starts over or under as needed by the threads it crosses, which a
+    planar knotwork always allows; otherwise some crossings do not alternate along their second strand.
+    """
+    thread = np.asarray(thread, dtype=np.intp)
+    c = len(thread)
+    if not c:
+        return np.zeros(0, dtype=bool)
+    order = np.lexsort((np.ravel(position), thread.ravel()))
+    parity = np.empty(2 * c, dtype=np.intp)
+    parity[order] = (np.arange(2 * c) - np.searchsorted(thread.ravel()[order], thread.ravel()[order])) % 2
+    parity = parity.reshape(c, 2)
+    # with phase[t] the parity of the first over crossing of thread t, a crossing needs one strand over :
+    # phase[t0] ^ phase[t1] == 1 ^ parity0 ^ parity1, solved thread after thread
+    source = thread.ravel()
+    target = thread[:, ::-1].ravel()
+    need = np.repeat(1 ^ parity[:, 0] ^ parity[:, 1], 2)
+    order = np.argsort(source, kind="stable")
+    target, need = target[order], need[order]
+    offsets = np.searchsorted(source[order], np.arange(thread.max() + 2))
+    phase = np.full(thread.max() + 1, -1, dtype=np.intp)
+    for root in np.unique(source).tolist():
+        if phase[root] >= 0:
+            continue
+        phase[root] = 0
+        stack = [root]
+        while stack:
+            t = stack.pop()
+            others = target[offsets[t]:offsets[t + 1]]
+            new = phase[others] < 0
+            phase[others[new]] = phase[t] ^ need[offsets[t]:offsets[t + 1]][new]
+            stack.extend(np.unique(others[new]).tolist())
+    return parity[:, 0] == phase[thread[:, 0]]
+
+def _normed_array(p):
+    return p / np.linalg.norm(p, axis=1)[:, None]
+
+def _rotate_45_array(p, clockwise):
+    # same as rotate_45, on an (n, 2) array with an (n,) boolean array of orientations
+    b = sqrt(2) / 2
+    x, y = p[:, 0], p[:, 1]
+    cw = np.stack((b * (x - y), b * (x + y)), axis=1)
+    ccw = np.stack((b * (x + y), b * (y - x)), axis=1)
+    return np.where(np.asarray(clockwise)[:, None], cw, ccw)
+
+def arc_controls(u, v, w, clock, spread, loop_size):
+    """Control points of the knotwork arcs going around v from the middle of (u, v) to the middle of (v, w).
+
+    u, v, w are (n, 2) coordinate arrays and clock an (n,) boolean array. Returns the (n, 4, 2)
+    control points and the (n,) cos factors expected by cubic_bezier_array / cubic_hermite_array.
+    """
+    mid1 = 0.5 * (u + v)
+    mid2 = 0.5 * (v + w)
+    dist = np.linalg.norm(mid1 - mid2, axis=1)
+    loop = dist <= 1e-14
+    dist[loop] = loop_size / spread * np.linalg.norm(v[loop] - u[loop], axis=1)
+    clock = np.asarray(clock, dtype=bool)
+    n1 = _rotate_45_array(_normed_array(v - u), clock)
+    p1 = spread * dist[:, None] * n1
+    n2 = _rotate_45_array(_normed_array(v - w), ~clock)
+    p2 = spread * dist[:, None] * n2
+    cos = np.sum(n1 * n2, axis=1)
+    return np.stack((mid1, mid1 + p1, mid2 + p2, mid2), axis=1), cos
+
+def _lattice_edges(n, m, steps):
+    # edges from every point (i, j) of an n x m index lattice to (i + di, j + dj), when inside it
+    i, j = np.divmod(np.arange(n * m, dtype=np.intp), m)
+    edges = []
+    for di, dj in steps:
+        a = np.flatnonzero((0 <= i + di) & (i + di < n) & (0 <= j + dj) & (j + dj < m))
+        edges.append(np.column_stack((a, a + di * m + dj)))
+    return np.concatenate(edges)
+
+def square_lattice(n, m, spacing=1):
+    """Points and nearest neighbour edges of an n x m square lattice, as (n * m, 2) and (k, 2) arrays.
+
+    Point i * m + j is at (i * spacing, j * spacing).
+    """
+    i, j = np.divmod(np.arange(n * m), m)
+    return spacing * np.column_stack((i, j)).astype(float), _lattice_edges(n, m, [(1, 0), (0, 1)])
+
+def triangular_lattice(n, m, spacing=1):
+    """Points and nearest neighbour edges of an n x m triangular lattice (a parallelogram), as in square_lattice.
+
+    Point i * m + j is at (i + j / 2, j * sqrt(3) / 2) * spacing.
+    """
+    i, j = np.divmod(np.arange(n * m), m)
+    points = spacing * np.column_stack((i + j / 2, j * sqrt(3) / 2))
+    return points, _lattice_edges(n, m, [(1, 0), (0, 1), (-1, 1)])
+
+def hexagonal_lattice(n, m, spacing=1):
+    """Points and edges of the honeycomb left by removing the points with (i - j) % 3 == 0 from triangular_lattice(n, m)."""
+    points, edges = triangular_lattice(n, m, spacing)
+    i, j = np.divmod(np.arange(n * m), m)
+    keep = (i - j) % 3 != 0
+    index = np.cumsum(keep) - 1
+    edges = edges[keep[edges].all(axis=1)]
+    return points[keep], index[edges]
+
+LATTICES = { # name -> function of (n, m, spacing=1) returning the points and edges of that lattice
+    "square": square_lattice,
+    "triangular": triangular_lattice,
+    "hexagonal": hexagonal_lattice,
+}
+
+def _mirror(mask, axis):
+    """Copy the first half of a boolean array onto its second half, reversed along the given axis."""
+    k = mask.shape[axis]
+    first = np.arange(k) <= k - 1 - np.arange(k)
+    shape = [1] * mask.ndim
+    shape[axis] = k
+    return np.where(first.reshape(shape), mask, np.flip(mask, axis))
+
+def generate_edges(n, m, density=0.5, symmetry="None", seed=None):
+    """Random edges of a generated kolam on an n x m square lattice, as an (k, 2) array of point indices i * m + j.
+
+    Every lattice edge is kept with probability density, once per orbit of the symmetry : "None",
+    "Vertical" (i -> n - 1 - i), "Horizontal" (j -> m - 1 - j) or "Radial" (quarter turns, needs n == m).
+    seed is anything np.random.default_rng accepts.
+    """
+    if symmetry == "Radial" and n != m:
+        raise ValueError(f"Radial symmetry needs a square lattice, got {n} x {m}")
+    rng = np.random.default_rng(seed)
+    H = rng.random((max(n - 1, 0), m)) < density # (i, j) - (i + 1, j)
+    V = rng.random((n, max(m - 1, 0))) < density # (i, j) - (i, j + 1)
+    if symmetry == "Vertical":
+        H = _mirror(H, 0)
+        V = _mirror(V, 0)
+    elif symmetry == "Horizontal":
+        H = _mirror(H, 1)
+        V = _mirror(V, 1)
+    elif symmetry == "Radial":
+        # a half turn maps H onto itself reversed, a quarter turn maps H[i, j] onto V[j, n - 2 - i]
+        H = _mirror(H.ravel(), 0).reshape(H.shape)
+        V = H[::-1].T
+    elif symmetry != "None":
+        raise ValueError(f"Unknown symmetry {symmetry}")
+    i, j = np.nonzero(H)
+    h = np.column_stack((i * m + j, (i + 1) * m + j))
+    i, j = np.nonzero(V)
+    v = np.column_stack((i * m + j, i * m + j + 1))
+    return np.concatenate((h, v)).astype(np.intp)
+
+def generate_grid(n, m, density=0.5, symmetry="None", seed=None, spacing=1, cls=None):
+    """CompactGrid (or cls) of a kolam generated by generate_edges, point (i, j) being at (i * spacing, j * spacing)."""
+    points, _ = square_lattice(n, m, spacing)
+    G = (cls or CompactGrid).from_arrays(points, generate_edges(n, m, density, symmetry, seed))
+    G.set_symmetry(symmetry)
+    return G
+
+SYMMETRIES = { # linear part of the generators of each symmetry, around the center of the points
+    "None": [],
+    "Vertical": [((-1, 0), (0, 1))],
+    "Horizontal": [((1, 0), (0, -1))],
+    "Radial": [((0, -1), (1, 0))],
+    "HalfTurn": [((-1, 0), (0, -1))],
+    "Mirrors": [((-1, 0), (0, 1)), ((1, 0), (0, -1))],
+    "Dihedral": [((-1, 0), (0, 1)), ((0, -1), (1, 0))],
+}
+
+def point_permutations(xy, symmetry="None"):
+    """Permutations of the points xy (n, 2) under the generators of the given symmetry, see SYMMETRIES.
+
+    perm[i] is the index of the image of point i. Raises ValueError if the points are not symmetric.
+    """
+    xy = np.asarray(xy, dtype=float)
+    if symmetry not in SYMMETRIES:
+        raise ValueError(f"Unknown symmetry {symmetry}")
+    if len(xy) == 0:
+        return []
+    center = 0.5 * (xy.min(axis=0) + xy.max(axis=0))
+    points = np.round(xy, 6)
+    order = np.lexsort(points.T[::-1])
+    perms = []
+    for matrix in SYMMETRIES[symmetry]:
+        image = np.round((xy - center) @ np.array(matrix, dtype=float).T + center, 6)
+        image_order = np.lexsort(image.T[::-1])
+        if not np.array_equal(points[order], image[image_order]):
+            raise ValueError(f"The points do not have the {symmetry} symmetry")
+        perm = np.empty(len(xy), dtype=np.intp)
+        perm[image_order] = order
+        perms.append(perm)
+    return perms
+
+def symmetry_group(xy, symmetry="None"):
+    """All the elements of the given symmetry group of the points xy, as (matrix, perm) pairs, identity first.
+
+    matrix is the (3, 3) affine map of the plane and perm the permutation of the points it induces,
+    as in point_permutations.
+    """
+    xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+    perms = point_permutations(xy, symmetry)
+    center = 0.5 * (xy.min(axis=0) + xy.max(axis=0)) if len(xy) else np.zeros(2)
+    generators = []
+    for linear, perm in zip(SYMMETRIES[symmetry], perms):
+        matrix = np.eye(3)
+        matrix[:2, :2] = linear
+        matrix[:2, 2] = center - matrix[:2, :2] @ center
+        generators.append((matrix, perm))
+    group = [(np.eye(3), np.arange(len(xy)))]
+    seen = {(tuple(group[0][1].tolist()), tuple(np.round(group[0][0], 9).ravel().tolist()))}
+    for matrix, perm in group: # grows while iterating, until closed
+        for generator, generator_perm in generators:
+            element = (generator @ matrix, generator_perm[perm])
+            key = (tuple(element[1].tolist()), tuple(np.round(element[0], 9).ravel().tolist()))
+            if key not in seen:
+                seen.add(key)
+                group.append(element)
+    return group
+
+def edge_images(edges, perms):
+    """Edge permutations induced by the point permutations perms, rows[g][i] being the index of the image of edge i."""
+    edges = np.sort(np.asarray(edges, dtype=np.intp).reshape(-1, 2), axis=1)
+    n = max([edges.max() + 1 if len(edges) else 0] + [len(perm) for perm in perms])
+    keys = edges[:, 0] * n + edges[:, 1]
+    order = np.argsort(keys)
+    images = []
+    for perm in perms:
+        image = np.sort(perm[edges], axis=1)
+        image_keys = image[:, 0] * n + image[:, 1]
+        row = order[np.searchsorted(keys, image_keys, sorter=order).clip(max=max(len(keys) - 1, 0))]
+        if not np.array_equal(keys[row], image_keys):
+            raise ValueError("The edges are not symmetric")
+        images.append(row)
+    return images
+
+def edge_group(edges, perms):
+    """All the edge permutations of the group generated by the point permutations perms, as a (g, m) array, identity first."""
+    generators = edge_images(edges, perms)
+    group = {tuple(range(len(edges))) : None}
+    todo = list(group)
+    while todo:
+        element = np.array(todo.pop(), dtype=np.intp)
+        for generator in generators:
+            image = tuple(generator[element].tolist())
+            if image not in group:
+                group[image] = None
+                todo.append(image)
+    return np.array(list(group), dtype=np.intp).reshape(len(group), len(edges))
+
+def edge_orbits(edges, perms):
+    """Orbit of every edge (m, 2) under the point permutations perms, as the index of the first edge of the orbit."""
+    images = edge_images(edges, perms)
+    label = np.arange(len(np.asarray(edges).reshape(-1, 2)))
+    while True:
+        new = label
+        for row in images:
+            new = np.minimum(new, new[row])
+        if np.array_equal(new, label):
+            return label
+        label = new
+
 if __name__ == "__main__":
     l_classic = [Point(0, 1), Point(0, -1), Point(1, 0), Point(-1, 0), Point(0, 0), Point(0, 2), Point(1, 1), Point(-1, 1)]
     G_classic = Grid(l_classic)
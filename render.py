@@ -0,0 +1,95 @@
+"""Headless batch rendering of saved grids.
+
+Renders every grid saved by the GUI (text or .npz, see Grid.save) found in the given files,
+directories or manifests to SVG or PNG, in parallel over a pool of processes.
+
+    python render.py saves/ -o renders/ --format svg
+    python render.py --manifest nightly.txt -o renders/ --format png -j 8
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import perf_counter
+
+import matplotlib
+matplotlib.use("Agg") # no display needed
+import matplotlib.pyplot as plt
+import numpy as np
+
+from mercat import CompactGrid
+
+
+def render_file(path, outdir, fmt, spread, loop_size, interp, dpi, tolerance=None):
+    """Render one saved grid, returns (output file, number of threads, seconds).
+
+    PNG arcs are flattened within tolerance pixels, or sampled at 100 points each when it is None.
+    """
+    start = perf_counter()
+    G = CompactGrid.load(path)
+    G.validate() # crossing links would give meaningless threads
+    out = os.path.join(outdir, os.path.splitext(os.path.basename(path))[0] + "." + fmt)
+    if fmt == "svg":
+        G.save_svg(out, spread, loop_size, interp=interp)
+    else:
+        fig = plt.figure()
+        if tolerance is not None:
+            # the grid spans at most the whole figure, so this overestimates the size of a pixel in grid units
+            span = np.ptp(G.coords(), axis=0).max() if len(G) else 1
+            tolerance = tolerance * span / (min(fig.get_size_inches()) * dpi)
+        G.plot_knotwork(spread, loop_size, color_each_thread=True, interp=interp, tolerance=tolerance)
+        plt.savefig(out, dpi=dpi, bbox_inches="tight")
+        plt.close()
+    return out, len(G.threads()), perf_counter() - start
+
+
+def collect_inputs(paths, manifest=None):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, f) for f in os.listdir(path) if not f.startswith(".") and os.path.isfile(os.path.join(path, f)))
+        else:
+            files.append(path)
+    if manifest is not None:
+        with open(manifest) as fh:
+            base = os.path.dirname(manifest)
+            files += [os.path.join(base, line.strip()) for line in fh if line.strip() and not line.startswith("#")]
+    return files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render saved kolam grids without a display.")
+    parser.add_argument("inputs", nargs="*", help="saved grids, or directories of saved grids")
+    parser.add_argument("-m", "--manifest", help="text file listing saved grids, one per line, relative to the manifest")
+    parser.add_argument("-o", "--outdir", default=".", help="output directory")
+    parser.add_argument("-f", "--format", choices=["svg", "png"], default="svg")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes (default: all cores)")
+    parser.add_argument("--spread", type=float, default=0.75)
+    parser.add_argument("--loop-size", type=float, default=1.6)
+    parser.add_argument("--interp", choices=["bezier", "hermite"], default="bezier")
+    parser.add_argument("--dpi", type=int, default=200, help="resolution of PNG output")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="flattening tolerance of PNG output, in pixels (0 : 100 samples per arc)")
+    args = parser.parse_args(argv)
+
+    files = collect_inputs(args.inputs, args.manifest)
+    if not files:
+        parser.error("no input grids")
+    os.makedirs(args.outdir, exist_ok=True)
+
+    start = perf_counter()
+    failures = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        jobs = {pool.submit(render_file, path, args.outdir, args.format, args.spread, args.loop_size, args.interp, args.dpi, args.tolerance or None): path for path in files}
+        for job in as_completed(jobs):
+            path = jobs[job]
+            try:
+                out, threads, seconds = job.result()
+                print(f"{path} -> {out} : {threads} thread(s) in {seconds:.3f}s", flush=True)
+            except Exception as e:
+                failures += 1
+                print(f"{path} : failed ({e})", flush=True)
+    print(f"{len(files) - failures}/{len(files)} grid(s) rendered in {perf_counter() - start:.3f}s")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
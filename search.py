@@ -0,0 +1,139 @@
+"""Markov-chain search for kolams with a given number of threads, single-stroke ones by default.
+
+Starts from a random subset of the edges of a lattice and toggles one edge (or one orbit of edges
+under the chosen symmetry) at a time. Only the threads going through the toggled edges are traced
+again, by a Knotwork, so a move costs the length of these threads rather than a whole Grid.threads().
+
+    python search.py 13 13 --symmetry Radial --seed 3 -o saves/single.npz
+"""
+import argparse
+from math import exp
+from random import Random
+from time import perf_counter
+
+import numpy as np
+
+from mercat import Grid, CompactGrid, Knotwork, Point, LATTICES, SYMMETRIES, edge_orbits, point_permutations
+
+
+class StrokeSearch(object):
+    """Metropolis walk over the symmetric edge subsets of a lattice (points (n, 2), edges (m, 2)).
+
+    The energy is the distance between the number of threads and target, plus, when cover is set,
+    the number of pullis left without any edge. Moves raising it by d are accepted with probability
+    exp(-d / temperature), so the walk can leave local minima.
+    """
+
+    def __init__(self, points, edges, target=1, symmetry="None", density=0.5, temperature=0.3, cover=True, seed=None):
+        self.random = Random(seed)
+        self.points = [Point(x, y) for x, y in np.asarray(points, dtype=float).tolist()]
+        self.edges = np.asarray(edges, dtype=np.intp).reshape(-1, 2)
+        self.target = target
+        self.temperature = temperature
+        self.cover = cover
+        self.symmetry = symmetry
+        labels = edge_orbits(self.edges, point_permutations(points, symmetry))
+        self.orbits = [[] for _ in range(len(labels))]
+        for i, label in enumerate(labels.tolist()):
+            self.orbits[label].append(i)
+        self.orbits = [orbit for orbit in self.orbits if orbit]
+        self.on = [False] * len(self.orbits)
+        self.knotwork = Knotwork(Grid(list(self.points)), 1, 2) # the curves are never computed
+        self.isolated = len(self.points)
+        for k in range(len(self.orbits)):
+            if self.random.random() < density:
+                self.toggle(k)
+        self.energy = self._energy()
+        self.steps = 0
+        self.accepted = 0
+
+    def _energy(self):
+        return abs(len(self.knotwork) - self.target) + (self.isolated if self.cover else 0)
+
+    def toggle(self, k):
+        """Add or remove all the edges of the k-th orbit."""
+        self.on[k] = not self.on[k]
+        edges = [(self.points[i], self.points[j]) for i, j in self.edges[self.orbits[k]].tolist()]
+        ends = {p for edge in edges for p in edge}
+        neighbours = self.knotwork.grid.edges
+        self.isolated -= sum(not neighbours[p] for p in ends)
+        if self.on[k]:
+            self.knotwork.update(added=edges)
+        else:
+            self.knotwork.update(removed=edges)
+        self.isolated += sum(not neighbours[p] for p in ends)
+
+    def step(self):
+        """Try to toggle a random orbit, returns whether the move was kept."""
+        k = self.random.randrange(len(self.orbits))
+        self.toggle(k)
+        energy = self._energy()
+        self.steps += 1
+        if energy <= self.energy or self.random.random() < exp((self.energy - energy) / self.temperature):
+            self.energy = energy
+            self.accepted += 1
+            return True
+        self.toggle(k)
+        return False
+
+    def run(self, max_steps, report=None):
+        """Walk until the energy is 0 or for max_steps moves, returns whether the target was reached.
+
+        report, if given, is called every 1000 moves with the search itself.
+        """
+        for i in range(max_steps):
+            if self.energy == 0:
+                break
+            self.step()
+            if report is not None and i % 1000 == 0:
+                report(self)
+        return self.energy == 0
+
+    def thread_count(self):
+        return len(self.knotwork)
+
+    def edge_mask(self):
+        """Boolean mask of the edges currently in the kolam."""
+        mask = np.zeros(len(self.edges), dtype=bool)
+        for k, orbit in enumerate(self.orbits):
+            mask[orbit] = self.on[k]
+        return mask
+
+    def grid(self, cls=CompactGrid):
+        """Current kolam, on all the points of the lattice, with the symmetry of the search declared."""
+        G = cls.from_arrays([(p.x, p.y) for p in self.points], self.edges[self.edge_mask()])
+        G.set_symmetry(self.symmetry)
+        return G
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search a lattice for kolams with a given number of threads.")
+    parser.add_argument("n", type=int, help="number of rows of the lattice")
+    parser.add_argument("m", type=int, help="number of columns of the lattice")
+    parser.add_argument("-l", "--lattice", choices=list(LATTICES), default="square")
+    parser.add_argument("-s", "--symmetry", choices=list(SYMMETRIES), default="None")
+    parser.add_argument("-t", "--target", type=int, default=1, help="number of threads (default: single stroke)")
+    parser.add_argument("--density", type=float, default=0.5, help="density of the starting kolam")
+    parser.add_argument("--temperature", type=float, default=0.3)
+    parser.add_argument("--no-cover", action="store_true", help="allow pullis without any edge")
+    parser.add_argument("--steps", type=int, default=100000, help="maximum number of moves")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("-o", "--output", help="save the kolam found (.npz or text, see Grid.save)")
+    args = parser.parse_args(argv)
+
+    points, edges = LATTICES[args.lattice](args.n, args.m)
+    start = perf_counter()
+    try:
+        search = StrokeSearch(points, edges, args.target, args.symmetry, args.density, args.temperature, not args.no_cover, args.seed)
+    except ValueError as e: # symmetry the lattice does not have
+        parser.error(str(e))
+    found = search.run(args.steps)
+    print(f"{'found' if found else 'not found'} : {search.thread_count()} thread(s), {search.isolated} isolated pulli(s), "
+          f"{search.steps} moves ({search.accepted} accepted) in {perf_counter() - start:.3f}s")
+    if found and args.output:
+        search.grid().save(args.output)
+    return 0 if found else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())